@@ -1,5 +1,1040 @@
-import os, struct
+import os, sys, gc, io, glob, json, time, timeit, logging, struct, mmap, array, multiprocessing, multiprocessing.pool, threading, collections, hashlib, cPickle, cStringIO
+import zlib, bz2, zipfile, tarfile, posixpath
 import numpy as np
+try:
+    import lzma
+except ImportError:
+    # The lzma module is only in the standard library from Python 3.3, and xz files cannot be read without it
+    lzma = None
+
+__version__ = '0.0.1'
+
+# Progress and events are reported through this logger, which is silent unless configured
+_log = logging.getLogger('OpenFlight')
+_log.addHandler(logging.NullHandler())
+
+# Bumped whenever the layout of the on-disk parse cache changes
+_CacheFormat = 4
+# The data and tree files of a parse cache entry both hold a random token of this many bytes
+_CacheTokenBytes = 16
+# Arrays of at least this many bytes are stored alongside the cached tree and memory mapped
+_CacheArrayBytes = 1024
+
+# Precompiled big-endian layouts used by the scalar read functions
+_Float = struct.Struct('>f')
+_Double = struct.Struct('>d')
+_UShort = struct.Struct('>H')
+_Short = struct.Struct('>h')
+_UInt = struct.Struct('>I')
+_Int = struct.Struct('>i')
+_Bool = struct.Struct('>?')
+_UChar = struct.Struct('>B')
+_SChar = struct.Struct('>b')
+_Char = struct.Struct('>c')
+_RecordHeader = struct.Struct('>hH')
+
+# The fixed part of a texture attribute file, as (field name, layout) pairs. Reserved
+# areas have no name. The reserved sizes are those used before OpenFlight 16.1.
+_TextureAttributeFields = ([('NumberOfTexelsU', 'i'), ('NumberOfTexelsV', 'i'), (None, '8x'), ('xUp', 'i'), ('yUp', 'i'), ('FileFormatType', 'i'),
+                            ('MinificationFilterType', 'i'), ('MagnificationFilterType', 'i'), ('WrapMethod', 'i'), ('WrapMethodUV', 'i'),
+                            ('WrapMethodU', 'i'), ('WrapMethodV', 'i'), ('ModifiedFlag', 'i'), ('xPivot', 'i'), ('yPivot', 'i'),
+                            ('EnvironmentType', 'i'), ('IntensityPattern', 'i'), (None, '32x'), ('RealWorldSizeDirectionU', 'd'),
+                            ('RealWorldSizeDirectionV', 'd'), ('CodeForOriginOfImportedTexture', 'i'), ('KernelVersionNumber', 'i'),
+                            ('InternalFormatType', 'i'), ('ExternalFormatType', 'i'), ('MIPMAP', 'i'), ('SeparableSymmetricFilterKernel', '8f'),
+                            ('SendTXControlPoints', 'i')] +
+                           [(varName + str(idx), 'f') for idx in range(8) for varName in ['LOD', 'Scale']] +
+                           [('ControlClamp', 'f'), ('AlphaMagnificationFilterType', 'i'), ('ColourMagnificationFilterType', 'i'), (None, '36x'),
+                            ('LambertConicProjectionCentralMeridian', 'd'), ('LambertConicProjectionUpperLatitude', 'd'),
+                            ('LambertConicProjectionLowerLatitude', 'd'), (None, '28x'), ('UsingTXDetail', 'i'), ('JTXDetail', 'i'),
+                            ('KTXDetail', 'i'), ('MTXDetail', 'i'), ('NTXDetail', 'i'), ('ScrambleTXDetail', 'i'), ('UsingTXTile', 'i'),
+                            ('LowerLeftUTXTile', 'f'), ('LowerLeftVTXTile', 'f'), ('UpperRightUTXTile', 'f'), ('UpperRightVTXTile', 'f'),
+                            ('Projection', 'i'), ('EarthModel', 'i'), (None, '4x'), ('UTMZone', 'i'), ('ImageOrigin', 'i'),
+                            ('GeospecificPointsUnits', 'i'), (None, '8x'), ('HemisphereForGeospecificPointsUnits', 'i'), (None, '12x'),
+                            ('TextureForCubemap', 'i'), (None, '588x'), ('Comments', '512s'), (None, '52x'), ('AttributeFileVersionNumber', 'i'),
+                            ('NumberOfGeospecificControlPoints', 'i')])
+_TextureAttributeLayout = struct.Struct('>' + ''.join(fmt for varName, fmt in _TextureAttributeFields))
+
+# The accepted values of the enumerated texture attribute fields, in the order they are checked
+_TextureAttributeChecks = [('FileFormatType', range(6), 'Unable to determine file format type.'),
+                           ('MinificationFilterType', range(13), 'Unable to determine minification filter type.'),
+                           ('MagnificationFilterType', range(11), 'Unable to determine magnification filter type.'),
+                           ('WrapMethodUV', [0, 1, 4], 'Unable to determine wrap method u,v.'),
+                           ('WrapMethodU', [0, 1, 3, 4], 'Unable to determine wrap method u.'),
+                           ('WrapMethodV', [0, 1, 3, 4], 'Unable to determine wrap method v.'),
+                           ('EnvironmentType', range(5), 'Unable to determine environment type.'),
+                           ('InternalFormatType', range(10), 'Unable to determine internal format type.'),
+                           ('ExternalFormatType', range(3), 'Unable to determine external format type.'),
+                           ('AlphaMagnificationFilterType', range(11), 'Unable to determine magnification filter type for alpha.'),
+                           ('ColourMagnificationFilterType', range(11), 'Unable to determine magnification filter type for colour.'),
+                           ('Projection', [0, 3, 4, 7], 'Unable to determine projection.'),
+                           ('EarthModel', range(5), 'Unable to determine earth model.'),
+                           ('ImageOrigin', [0, 1], 'Unable to determine image origin.'),
+                           ('GeospecificPointsUnits', range(3), 'Unable to determine geospecific points units.'),
+                           ('HemisphereForGeospecificPointsUnits', [0, 1], 'Unable to determine hemisphere for geospecific points units.')]
+
+class Record(object):
+    """The Record is a compact, slot based alternative to the
+       dictionaries used for decoded records. Fields are held as
+       attributes, but can also be read and written with the usual
+       dictionary syntax, so existing code keeps working.
+    """
+    
+    __slots__ = ()
+    
+    def __init__(self, varNames = (), values = ()):
+        for varName, value in zip(varNames, values):
+            setattr(self, varName, value)
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+    
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+    
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+    
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(self.keys())
+    
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.asDict() == dict(other.items())
+        return NotImplemented
+    
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+    
+    def __repr__(self):
+        return repr(self.asDict())
+    
+    def __reduce__(self):
+        # The classes are created on demand, so rebuild them when unpickling
+        return (_rebuildRecord, (type(self).__name__, self.__slots__, self.asDict()))
+    
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+    
+    def values(self):
+        return [getattr(self, key) for key in self.keys()]
+    
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+    
+    def get(self, key, default = None):
+        return getattr(self, key, default)
+    
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = getattr(self, key)
+        delattr(self, key)
+        return value
+    
+    def asDict(self):
+        """
+            Returns the record as a plain dictionary.
+        """
+        return dict(self.items())
+
+
+# Compact record classes, keyed by class name and slots
+_RecordClasses = dict()
+
+def _recordClass(name, varNames):
+    """
+        Returns the compact record class for a record name and its fields,
+        creating it on first use.
+    """
+    if not name.endswith('Record'):
+        name = ''.join(word[0].upper() + word[1:] for word in name.split()) + 'Record'
+    slots = ('Datatype', ) + tuple(varNames)
+    key = (name, slots)
+    if key not in _RecordClasses:
+        _RecordClasses[key] = type(name, (Record, ), {'__slots__': slots})
+    return _RecordClasses[key]
+
+def _rebuildRecord(name, slots, state):
+    record = _recordClass(name, slots[1:])()
+    for key, value in state.items():
+        setattr(record, key, value)
+    return record
+
+# Dispatch tables with the handlers of each reader class, keyed by class
+_DispatchTables = dict()
+
+def _dispatchTable(readerClass):
+    """
+        Returns the dispatch table for a reader class, looking up each handler
+        in _OpCodes by name on first use, so that handlers overridden in a
+        subclass are called.
+    """
+    if readerClass not in _DispatchTables:
+        table = dict()
+        for opCode, (handler, size, name) in readerClass._OpCodes.items():
+            handler = getattr(readerClass, handler.__name__)
+            table[opCode] = (getattr(handler, '__func__', handler), size, name)
+        _DispatchTables[readerClass] = table
+    return _DispatchTables[readerClass]
+
+# Instrumented reads count allocations with the number of allocated memory blocks where Python
+# provides it. Otherwise the collector's count of new container objects is used, which every
+# collection resets, so collections are paused while instrumenting.
+_PauseCollections = not hasattr(sys, 'getallocatedblocks')
+if _PauseCollections:
+    def _allocationCount():
+        return gc.get_count()[0]
+else:
+    _allocationCount = sys.getallocatedblocks
+
+def _columnProperty(name):
+    return property(lambda self: self._Data[name][:self._Count], doc = "The " + name + " column, one row per vertex.")
+
+class VertexStore(collections.Mapping):
+    """The VertexStore holds the vertex palette of an OpenFlight
+       database in columns, with one array per field and one row
+       per vertex. Vertices are located by their byte offset in the
+       vertex palette, as used by vertex list records. The columns
+       take 62 bytes per vertex.
+       
+       The store only saves memory when vertices are decoded in bulk,
+       where the tree holds a vertex block node for each run of
+       vertices. Otherwise each vertex record is still added to the
+       tree as a dictionary, as before, and the store is held as well.
+       
+       For compatibility, the store is a read-only mapping from byte
+       offset to the vertex as a dictionary, as Records['Vertices']
+       used to be. The dictionaries are built on each access and are
+       copies, so changing them changes neither the store nor the
+       vertex records in the tree.
+    """
+    
+    # The tuple order for the columns is (name, dtype, shape of a row)
+    _Columns = [('ByteOffset', np.uint32, ()),
+                ('OpCode', np.int16, ()),
+                ('ColourNameIdx', np.uint16, ()),
+                ('Flags', np.uint16, ()),
+                ('Coordinate', np.float64, (3, )),
+                ('Normal', np.float32, (3, )),
+                ('TextureCoordinate', np.float32, (2, )),
+                ('PackedColour', np.uint32, ()),
+                ('VertexColourIndex', np.uint32, ())]
+    
+    _Datatypes = {68: 'VertexColour',
+                  69: 'VertexColourWithNormal',
+                  70: 'VertexColourWithNormalUV',
+                  71: 'VertexColourWithUV'}
+    
+    ByteOffset = _columnProperty('ByteOffset')
+    OpCode = _columnProperty('OpCode')
+    ColourNameIdx = _columnProperty('ColourNameIdx')
+    Flags = _columnProperty('Flags')
+    Coordinate = _columnProperty('Coordinate')
+    Normal = _columnProperty('Normal')
+    TextureCoordinate = _columnProperty('TextureCoordinate')
+    PackedColour = _columnProperty('PackedColour')
+    VertexColourIndex = _columnProperty('VertexColourIndex')
+    
+    def __init__(self):
+        self._Count = 0
+        self._Data = dict()
+        for name, dtype, shape in self._Columns:
+            self._Data[name] = np.zeros((0, ) + shape, dtype = dtype)
+    
+    def __len__(self):
+        return self._Count
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __contains__(self, byteOffset):
+        row = np.searchsorted(self.ByteOffset, byteOffset)
+        return row < self._Count and self._Data['ByteOffset'][row] == byteOffset
+    
+    def __getitem__(self, byteOffset):
+        row = self.rows([byteOffset])[0]
+        opCode = int(self._Data['OpCode'][row])
+        
+        vertex = dict()
+        vertex['Datatype'] = self._Datatypes[opCode]
+        for varName in ['ColourNameIdx', 'Flags', 'PackedColour', 'VertexColourIndex']:
+            vertex[varName] = int(self._Data[varName][row])
+        vertex['Coordinate'] = self._Data['Coordinate'][row].reshape((1, 3)).copy()
+        if opCode in [69, 70]:
+            vertex['Normal'] = self._Data['Normal'][row].reshape((1, 3)).astype(np.float64)
+        if opCode in [70, 71]:
+            vertex['TextureCoordinate'] = self._Data['TextureCoordinate'][row].reshape((1, 2)).astype(np.float64)
+        return vertex
+    
+    def keys(self):
+        return [int(byteOffset) for byteOffset in self.ByteOffset]
+    
+    def textureCoordinates(self):
+        """
+            Returns a list with the texture coordinate of each vertex, in
+            order, or None for vertices without one.
+        """
+        hasUV = np.in1d(self.OpCode, [70, 71])
+        return [coordinate.reshape((1, 2)).astype(np.float64) if uv else None for coordinate, uv in zip(self.TextureCoordinate, hasUV)]
+    
+    def rows(self, byteOffsets):
+        """
+            Returns the row indices of the vertices at the given byte offsets.
+            Raises a KeyError if any offset does not start a vertex.
+        """
+        byteOffsets = np.asarray(byteOffsets)
+        offsets = self.ByteOffset
+        rows = np.searchsorted(offsets, byteOffsets)
+        found = rows < self._Count
+        found[found] = offsets[rows[found]] == byteOffsets[found]
+        if not found.all():
+            raise KeyError('No vertex at byte offset ' + str(byteOffsets[~found][0]) + '.')
+        return rows
+    
+    def _reserve(self, count):
+        """
+            Grows the columns so that another count rows will fit.
+            An internal function.
+        """
+        capacity = len(self._Data['ByteOffset'])
+        if self._Count + count <= capacity:
+            return
+        capacity = max(self._Count + count, 2 * capacity, 1024)
+        for name, dtype, shape in self._Columns:
+            column = np.zeros((capacity, ) + shape, dtype = dtype)
+            column[:self._Count] = self._Data[name][:self._Count]
+            self._Data[name] = column
+    
+    def appendVertex(self, byteOffset, opCode, vertex):
+        """
+            Adds a single vertex from its record dictionary and returns its row.
+        """
+        self._reserve(1)
+        row = self._Count
+        self._Data['ByteOffset'][row] = byteOffset
+        self._Data['OpCode'][row] = opCode
+        for name, dtype, shape in self._Columns[2:]:
+            if name in vertex:
+                self._Data[name][row] = vertex[name]
+            else:
+                # Only normals and texture coordinates are optional
+                self._Data[name][row] = np.nan
+        self._Count += 1
+        return row
+    
+    def appendBlock(self, byteOffset, opCode, records):
+        """
+            Adds a run of vertex records decoded into a structured array and
+            returns the row of the first vertex.
+        """
+        count = len(records)
+        self._reserve(count)
+        rows = slice(self._Count, self._Count + count)
+        self._Data['ByteOffset'][rows] = byteOffset
+        self._Data['OpCode'][rows] = opCode
+        for name, dtype, shape in self._Columns[2:]:
+            if name in records.dtype.names:
+                self._Data[name][rows] = records[name]
+            else:
+                self._Data[name][rows] = np.nan
+        self._Count += count
+        return rows.start
+    
+    def trim(self):
+        """
+            Releases any spare capacity held by the columns.
+        """
+        for name in self._Data:
+            if len(self._Data[name]) > self._Count:
+                self._Data[name] = self._Data[name][:self._Count].copy()
+
+class FaceTable(object):
+    """The FaceTable holds the face and mesh records of an OpenFlight
+       database in columns, with one row per record. Columns can be
+       combined into masks to select faces without walking the tree,
+       for example all transparent faces using texture 12:
+       
+           (faces.column('Transparency') > 0) & (faces.column('TexturePatternIdx') == 12)
+       
+       Unset indices keep their file value of -1. For compatibility,
+       indexing the table with a row returns the record as a dictionary.
+    """
+    
+    # The field order matches the record layout, so decoded rows can be stored directly
+    _Dtype = np.dtype([('ASCIIID', 'S8'), ('IRColourCode', np.uint32), ('RelativePriority', np.int16), ('DrawType', np.uint8),
+                       ('TextureWhite', np.bool_), ('ColourNameIdx', np.uint16), ('AltColourNameIdx', np.uint16), ('Template', np.uint8),
+                       ('DetailTexturePatternIdx', np.int32), ('TexturePatternIdx', np.int32), ('MaterialIdx', np.int32),
+                       ('SurfaceMaterialCode', np.int16), ('FeatureID', np.int16), ('IRMaterialCode', np.uint32), ('Transparency', np.int32),
+                       ('LODGenerationControl', np.uint8), ('LineStyleIdx', np.uint8), ('Flags', np.uint32), ('LightMode', np.uint8),
+                       ('PackedColour', np.uint32), ('AltPackedColour', np.uint32), ('TextureMappingIdx', np.int16),
+                       ('PrimaryColourIdx', np.int32), ('AltColourIdx', np.int32), ('ShaderIdx', np.int16), ('OpCode', np.int16)])
+    
+    _Datatypes = {5: 'Face',
+                  84: 'Mesh'}
+    
+    # Indices which are read as None when unset
+    _Indices = ['DetailTexturePatternIdx', 'TexturePatternIdx', 'MaterialIdx', 'TextureMappingIdx', 'PrimaryColourIdx', 'AltColourIdx', 'ShaderIdx']
+    
+    def __init__(self):
+        self._Count = 0
+        self._Data = np.zeros(0, dtype = self._Dtype)
+    
+    def __len__(self):
+        return self._Count
+    
+    def __getitem__(self, row):
+        if row < 0 or row >= self._Count:
+            raise IndexError('No face at row ' + str(row) + '.')
+        record = self._Data[row]
+        opCode = int(record['OpCode'])
+        
+        face = dict()
+        face['Datatype'] = self._Datatypes[opCode]
+        for varName in self._Dtype.names[:-1]:
+            face[varName] = record[varName].item()
+        if opCode == 5:
+            # Face records name this field differently
+            face['IRColCode'] = face.pop('IRColourCode')
+        for varName in self._Indices:
+            if face[varName] == -1:
+                face[varName] = None
+        return face
+    
+    @property
+    def names(self):
+        return list(self._Dtype.names)
+    
+    def column(self, name):
+        """
+            Returns the named column, with one entry per row.
+        """
+        return self._Data[name][:self._Count]
+    
+    def find(self, **criteria):
+        """
+            Returns the rows whose columns equal every one of the given values.
+        """
+        mask = np.ones(self._Count, dtype = np.bool_)
+        for name, value in criteria.items():
+            mask &= self.column(name) == value
+        return np.flatnonzero(mask)
+    
+    def append(self, opCode, values):
+        """
+            Adds a row from the decoded fields of a face or mesh record and
+            returns its index.
+        """
+        if self._Count == len(self._Data):
+            data = np.zeros(max(2 * self._Count, 1024), dtype = self._Dtype)
+            data[:self._Count] = self._Data
+            self._Data = data
+        row = self._Count
+        self._Data[row] = tuple(values) + (opCode, )
+        self._Count += 1
+        return row
+    
+    def trim(self):
+        """
+            Releases any spare capacity held by the table.
+        """
+        if len(self._Data) > self._Count:
+            self._Data = self._Data[:self._Count].copy()
+
+class ExternalCache(object):
+    """The ExternalCache keeps the records of external databases and
+       texture attribute files between reads, so that libraries shared
+       by many databases are only parsed once per process. Entries are
+       keyed by path and are invalidated when the modification time or
+       size of the file changes. The least recently used entries are
+       evicted once the estimated memory use exceeds maxBytes.
+       
+       Cached records are shared between readers and should be treated
+       as read only.
+    """
+    
+    def __init__(self, maxBytes = 256 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self._Entries = collections.OrderedDict()
+        self._Lock = threading.Lock()
+        self._Bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def __len__(self):
+        return len(self._Entries)
+    
+    def _stamp(self, fileName):
+        try:
+            info = os.stat(fileName)
+        except OSError:
+            return None
+        return (info.st_mtime, info.st_size)
+    
+    def get(self, fileName, variant = None):
+        """
+            Returns the cached value for a file, or None when the file is not
+            cached or has changed since it was added.
+        """
+        key = (os.path.abspath(fileName), variant)
+        stamp = self._stamp(fileName)
+        with self._Lock:
+            entry = self._Entries.pop(key, None)
+            if entry is not None and entry[0] != stamp:
+                self._Bytes -= entry[2]
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            # Move the entry to the most recently used end
+            self._Entries[key] = entry
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, fileName, variant, value):
+        """
+            Adds the value read from a file, evicting the least recently used
+            entries to stay within the memory budget.
+        """
+        key = (os.path.abspath(fileName), variant)
+        stamp = self._stamp(fileName)
+        if stamp is None:
+            return
+        size = _estimateSize(value)
+        if self.maxBytes is not None and size > self.maxBytes:
+            return
+        with self._Lock:
+            entry = self._Entries.pop(key, None)
+            if entry is not None:
+                self._Bytes -= entry[2]
+            self._Entries[key] = (stamp, value, size)
+            self._Bytes += size
+            while self.maxBytes is not None and self._Bytes > self.maxBytes:
+                oldKey, oldEntry = self._Entries.popitem(last = False)
+                self._Bytes -= oldEntry[2]
+                self.evictions += 1
+    
+    def clear(self):
+        """
+            Removes every entry. The statistics are kept.
+        """
+        with self._Lock:
+            self._Entries.clear()
+            self._Bytes = 0
+    
+    def stats(self):
+        """
+            Returns the hit, miss and eviction counts along with the current
+            number of entries and estimated size in bytes.
+        """
+        with self._Lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations,
+                    'entries': len(self._Entries), 'bytes': self._Bytes, 'maxBytes': self.maxBytes}
+
+def _estimateSize(value):
+    """
+        Estimates the memory held by a set of records. Arrays count their data
+        and shared objects are only counted once.
+    """
+    size = 0
+    seen = set()
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            size += item.nbytes
+            continue
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif isinstance(item, Record):
+            stack.extend(item.values())
+        elif hasattr(item, '__dict__'):
+            stack.append(item.__dict__)
+    return size
+
+# The cache shared by every reader in this process that opts in
+SharedExternalCache = ExternalCache()
+
+def _isPath(source):
+    """
+        Returns whether a source is a file name, rather than data held in
+        memory or a file object. OpenFlight data always starts with a zero
+        byte, so a string holding one is taken to be data.
+    """
+    return isinstance(source, basestring) and '\x00' not in source
+
+def _sourceName(source):
+    """
+        Returns the file name of a source, or None when it has none.
+    """
+    if _isPath(source):
+        return source
+    name = getattr(source, 'name', None)
+    if _isPath(name):
+        return name
+    return None
+
+def _describeSource(source):
+    """
+        Returns a name for a source to use in messages.
+    """
+    name = _sourceName(source)
+    if name is None:
+        return '<' + type(source).__name__ + '>'
+    return name
+
+def _sourceBuffer(source):
+    """
+        Returns a read-only buffer over data held in memory, without copying it.
+    """
+    if isinstance(source, memoryview):
+        # Memory views lack the buffer interface used by struct and numpy, but an array over them has it
+        source = np.asarray(source)
+    return buffer(source)
+
+def _sourceSize(source):
+    """
+        Returns the size in bytes of a file name, data or file object, or None
+        for compressed files, as their size is not known until they have been
+        decompressed.
+    """
+    if _compression(source) is not None:
+        return None
+    if _isPath(source):
+        return os.stat(source).st_size
+    if hasattr(source, 'read'):
+        position = source.tell()
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(position)
+        return size
+    return len(_sourceBuffer(source))
+
+# Compressed files are recognised by their first bytes. The tuple order is (magic bytes, format, file suffix)
+_CompressionFormats = [('\x1f\x8b', 'gzip', '.gz'),
+                       ('BZh', 'bz2', '.bz2'),
+                       ('\xfd7zXZ\x00', 'xz', '.xz')]
+
+# Compressed files are read and decompressed this many bytes at a time
+_CompressedChunkSize = 1 << 16
+
+def _compression(source):
+    """
+        Returns the compression format of a file name, data or file object,
+        or None when it is not compressed.
+    """
+    if _isPath(source):
+        f = open(source, 'rb')
+        try:
+            head = f.read(6)
+        finally:
+            f.close()
+    elif hasattr(source, 'read'):
+        position = source.tell()
+        source.seek(0)
+        head = source.read(6)
+        source.seek(position)
+    else:
+        head = _sourceBuffer(source)[:6]
+    for magic, compression, suffix in _CompressionFormats:
+        if head.startswith(magic):
+            return compression
+    return None
+
+def _decompressor(compression):
+    """
+        Returns a new decompressor for one stream of the given format.
+    """
+    if compression == 'gzip':
+        # Adding 16 to the window size makes zlib expect a gzip header
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    return lzma.LZMADecompressor()
+
+class _DecompressedStream(io.RawIOBase):
+    """The _DecompressedStream reads a gzip, bz2 or xz compressed
+       file object, decompressing it a chunk at a time. Files made
+       of several compressed streams, as written by concatenating
+       them, are read as one.
+       
+       Seeking forwards decompresses and discards the data in
+       between, and seeking backwards starts again from the
+       beginning of the file.
+    """
+    
+    def __init__(self, source, compression, closeSource = False):
+        io.RawIOBase.__init__(self)
+        self._source = source
+        self._compression = compression
+        self._closeSource = closeSource
+        self._rewind()
+    
+    def _rewind(self):
+        self._source.seek(0)
+        self._decompressor = _decompressor(self._compression)
+        self._Pending = ''
+        self._PendingOffset = 0
+        self._Position = 0
+        self._Finished = False
+    
+    def _fill(self):
+        """
+            Decompresses the next chunk of the file into the pending data.
+        """
+        data = self._source.read(_CompressedChunkSize)
+        if not data:
+            # Only zlib may hold back output until it is flushed
+            self._Pending = self._decompressor.flush() if self._compression == 'gzip' else ''
+            self._PendingOffset = 0
+            self._Finished = not self._Pending
+            return
+        output = []
+        while data:
+            try:
+                output.append(self._decompressor.decompress(data))
+            except EOFError:
+                # The previous stream ended exactly at the end of the last chunk
+                self._decompressor = _decompressor(self._compression)
+                continue
+            data = self._decompressor.unused_data
+            if data:
+                # Another stream follows the one that has just ended
+                self._decompressor = _decompressor(self._compression)
+        self._Pending = ''.join(output)
+        self._PendingOffset = 0
+    
+    def _advance(self, count, into = None):
+        """
+            Moves up to count bytes forward, copying them into the given
+            buffer if there is one, and returns the number moved.
+        """
+        moved = 0
+        while moved < count:
+            available = len(self._Pending) - self._PendingOffset
+            if available == 0:
+                if self._Finished:
+                    break
+                self._fill()
+                continue
+            size = min(count - moved, available)
+            if into is not None:
+                into[moved:moved + size] = self._Pending[self._PendingOffset:self._PendingOffset + size]
+            self._PendingOffset += size
+            moved += size
+        self._Position += moved
+        return moved
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def readinto(self, b):
+        return self._advance(len(b), b)
+    
+    def tell(self):
+        return self._Position
+    
+    def seek(self, offset, whence = os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._Position
+        elif whence == os.SEEK_END:
+            # The size is only known once everything has been decompressed
+            self._advance(sys.maxint)
+            offset += self._Position
+        if offset < self._Position:
+            self._rewind()
+        self._advance(offset - self._Position)
+        return self._Position
+    
+    def close(self):
+        if not self.closed and self._closeSource:
+            self._source.close()
+        io.RawIOBase.close(self)
+
+def _openCompressed(source, compression):
+    """
+        Returns a buffered file object that decompresses a compressed file
+        name, data or file object as it is read. File objects given by the
+        caller are not closed along with it.
+    """
+    if compression == 'xz' and lzma is None:
+        raise IOError('Unable to read xz compressed files without the lzma module.')
+    if _isPath(source):
+        stream = _DecompressedStream(open(source, 'rb'), compression, closeSource = True)
+    elif hasattr(source, 'read'):
+        stream = _DecompressedStream(source, compression)
+    else:
+        stream = _DecompressedStream(cStringIO.StringIO(_sourceBuffer(source)), compression)
+    return io.BufferedReader(stream, _CompressedChunkSize)
+
+def _sourceData(source):
+    """
+        Returns the whole content of data or a file object.
+    """
+    if hasattr(source, 'read'):
+        source.seek(0)
+        return source.read()
+    return _sourceBuffer(source)
+
+# The fixed part of a local file header in a zip archive, which is followed by the member name and extra field
+_ZipLocalHeader = struct.Struct('<4s2B4HL2L2H')
+
+def _bundlePath(name):
+    """
+        Returns the name of a file as it is looked up in a bundle: with
+        forward slashes, without a drive letter or leading separators, and
+        in lower case, as databases made on Windows do not keep it.
+    """
+    name = name.replace('\\', '/')
+    if name[1:2] == ':':
+        name = name[2:]
+    return posixpath.normpath(name).lstrip('/').lower()
+
+class Bundle(object):
+    """The Bundle reads databases from a zip or tar archive holding a
+       master file, its external references and its textures along with
+       their attribute files, without extracting anything to disk. The
+       archive is indexed once when the bundle is opened, and the bundle
+       is the resolver of the readers it makes, so external references
+       and texture attribute files are read straight from the archive:
+       
+           bundle = Bundle('deliverable.zip')
+           db = bundle.Reader()
+           db.ReadFile()
+       
+       Names stored in the databases are matched against the end of the
+       member paths, ignoring case, so absolute paths from the machine
+       that made the bundle still find their member, and archives with
+       member paths that differ only in case are refused. Members stored
+       without compression, in zip files and uncompressed tar files, are
+       read from a memory map of the archive without being copied. The
+       rest are decompressed as they are read, which for compressed tar
+       files means reading through the archive up to the member.
+    """
+    
+    def __init__(self, fileName):
+        self.fileName = fileName
+        # Members are keyed by their path, with the tuple order (stored name, data offset, size).
+        # The offset is None for members that must be decompressed.
+        self._Members = dict()
+        # Each trailing part of a member path maps to the member, or None when it is ambiguous
+        self._Suffixes = dict()
+        self._Map = None
+        self._Archive = None
+        self._Lock = threading.Lock()
+        self._file = open(fileName, 'rb')
+        try:
+            if zipfile.is_zipfile(fileName):
+                self._indexZip()
+            else:
+                self._indexTar()
+            self._Map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        except BaseException:
+            self.close()
+            raise
+    
+    def _indexZip(self):
+        """
+            Indexes the members of a zip archive.
+            An internal function.
+        """
+        self._Archive = zipfile.ZipFile(self._file)
+        for info in self._Archive.infolist():
+            if info.filename.endswith('/'):
+                continue
+            offset = None
+            if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+                # The data follows the local header, whose name and extra field may differ from the central directory
+                self._file.seek(info.header_offset)
+                header = _ZipLocalHeader.unpack(self._file.read(_ZipLocalHeader.size))
+                offset = info.header_offset + _ZipLocalHeader.size + header[10] + header[11]
+            self._addMember(info.filename, offset, info.file_size)
+    
+    def _indexTar(self):
+        """
+            Indexes the members of a tar archive, which may be compressed.
+            An internal function.
+        """
+        try:
+            self._Archive = tarfile.open(fileobj = self._file)
+        except tarfile.TarError:
+            raise IOError('Unable to read bundle. The file is not a zip or tar archive.')
+        stored = _compression(self.fileName) is None
+        for info in self._Archive.getmembers():
+            if not info.isreg():
+                continue
+            self._addMember(info.name, info.offset_data if stored and not info.issparse() else None, info.size)
+        if stored:
+            # Every member is read from the memory map
+            self._Archive.close()
+            self._Archive = None
+    
+    def _addMember(self, name, offset, size):
+        """
+            Adds a member to the index.
+            An internal function.
+        """
+        path = _bundlePath(name)
+        if path in self._Members and self._Members[path][0] != name:
+            # Names are matched ignoring case, so these members could not be told apart
+            raise IOError('Unable to read bundle. The members ' + self._Members[path][0] + ' and ' + name + ' differ only in case.')
+        member = (name, offset, size)
+        self._Members[path] = member
+        parts = path.split('/')
+        for idx in range(1, len(parts)):
+            suffix = '/'.join(parts[idx:])
+            # Members with the same name in different directories cannot be told apart by it
+            self._Suffixes[suffix] = None if suffix in self._Suffixes else member
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def __call__(self, name, kind):
+        """
+            Returns the data of the member for a name stored in a database, or
+            None when the bundle does not have it. External references are
+            also found compressed.
+        """
+        names = [name]
+        if kind == 'external':
+            names.extend(name + suffix for magic, compression, suffix in _CompressionFormats)
+        for name in names:
+            member = self._find(name)
+            if member is not None:
+                return self._readMember(member)
+        return None
+    
+    def _find(self, name):
+        """
+            Returns the member for a name, preferring the longest match at the
+            end of its path, or None when there is no single match.
+            An internal function.
+        """
+        parts = _bundlePath(name).split('/')
+        for idx in range(len(parts)):
+            path = '/'.join(parts[idx:])
+            member = self._Members.get(path) or self._Suffixes.get(path)
+            if member is not None:
+                return member
+        return None
+    
+    def _readMember(self, member):
+        """
+            Returns the data of a member, as a buffer over the memory map when
+            it is stored without compression.
+            An internal function.
+        """
+        name, offset, size = member
+        if offset is not None:
+            return buffer(self._Map, offset, size)
+        # The archive reads from a single file position, so one member is decompressed at a time
+        with self._Lock:
+            if isinstance(self._Archive, zipfile.ZipFile):
+                return self._Archive.read(name)
+            f = self._Archive.extractfile(name)
+            try:
+                return f.read()
+            finally:
+                f.close()
+    
+    def names(self):
+        """
+            Returns the sorted names of the members of the archive.
+        """
+        return sorted(member[0] for member in self._Members.itervalues())
+    
+    def read(self, name):
+        """
+            Returns the data of a member, looked up as names stored in
+            databases are.
+        """
+        member = self._find(name)
+        if member is None:
+            raise IOError('Could not find ' + name + ' in bundle.')
+        return self._readMember(member)
+    
+    def Reader(self, name = None, **options):
+        """
+            Returns a reader for a database in the bundle, using the bundle as
+            its resolver. Without a name, the master file is the OpenFlight
+            file nearest the top of the archive, which must be the only one
+            there. Any other keyword arguments are passed to the reader.
+        """
+        if name is None:
+            suffixes = tuple(['.flt'] + ['.flt' + suffix for magic, compression, suffix in _CompressionFormats])
+            candidates = [path for path in self._Members if path.endswith(suffixes)]
+            if not candidates:
+                raise IOError('No OpenFlight file found in bundle.')
+            depth = min(path.count('/') for path in candidates)
+            candidates = [path for path in candidates if path.count('/') == depth]
+            if len(candidates) > 1:
+                raise IOError('Unable to choose a master file in bundle. Pass the name of one of: ' + ', '.join(sorted(candidates)))
+            name = candidates[0]
+        return OpenFlight(self.read(name), resolver = self, **options)
+    
+    def close(self):
+        """
+            Closes the archive. Records that have been read remain valid, as
+            their values are copied out of the archive.
+        """
+        if self._Map is not None:
+            self._Map.close()
+            self._Map = None
+        if self._Archive is not None:
+            self._Archive.close()
+            self._Archive = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def _readExternal(task):
+    """
+        Reads an external reference in a worker process. References found in
+        the file are returned rather than read, along with any texture
+        attribute records, so that the parent can merge them.
+    """
+    fileName, options, exclude = task
+    extdb = OpenFlight(fileName, **options)
+    extdb._deferExternal = True
+    extdb.ReadFile(exclude = exclude)
+    records = extdb.Records
+    external = records['External']
+    records['External'] = dict()
+    return fileName, records, external, extdb._References, hasattr(extdb, 'e')
 
 class OpenFlight:
     """The OpenFlight is a base class that is capable of opening
@@ -9,275 +1044,394 @@ class OpenFlight:
        Version: 0.0.1
     """
     
-    def __init__(self, fileName = None, verbose = False, parent = None, tabbing = 0):
-        self._Checks = [self._check_filesize, self._check_header]
-        self._ErrorMessages = ['This file does not conform to OpenFlight standards. The file size is not a multiple of 4.',
-                               'This file does not conform to OpenFlight standards. The header is incorrect.']
-        self._OpenFlightFormats = {11:   'Flight11',
-                                   12:   'Flight12',
-                                   14:   'OpenFlight v14.0 and v14.1',
-                                   1420: 'OpenFlight v14.2',
-                                   1510: 'OpenFlight v15.1',
-                                   1540: 'OpenFlight v15.4',
-                                   1550: 'OpenFlight v15.5',
-                                   1560: 'OpenFlight v15.6',
-                                   1570: 'OpenFlight v15.7',
-                                   1580: 'OpenFlight v15.8',
-                                   1600: 'OpenFlight v16.0',
-                                   1610: 'OpenFlight v16.1',
-                                   1620: 'OpenFlight v16.2',
-                                   1630: 'OpenFlight v16.3',
-                                   1640: 'OpenFlight v16.4'}
+    # The format tables are shared by every instance, so that creating readers is cheap
+    _ErrorMessages = ['This file does not conform to OpenFlight standards. The file size is not a multiple of 4.',
+                      'This file does not conform to OpenFlight standards. The header is incorrect.']
+    _OpenFlightFormats = {11:   'Flight11',
+                          12:   'Flight12',
+                          14:   'OpenFlight v14.0 and v14.1',
+                          1420: 'OpenFlight v14.2',
+                          1510: 'OpenFlight v15.1',
+                          1540: 'OpenFlight v15.4',
+                          1550: 'OpenFlight v15.5',
+                          1560: 'OpenFlight v15.6',
+                          1570: 'OpenFlight v15.7',
+                          1580: 'OpenFlight v15.8',
+                          1600: 'OpenFlight v16.0',
+                          1610: 'OpenFlight v16.1',
+                          1620: 'OpenFlight v16.2',
+                          1630: 'OpenFlight v16.3',
+                          1640: 'OpenFlight v16.4'}
+    _ObsoleteOpCodes = [3, 6, 7, 8, 9, 12, 13, 16, 17, 40, 41, 42, 43, 44, 45, 46, 47, 48, 51, 65, 66, 77]
+    # Named sets of opcodes that ReadFile can be asked to decode or skip
+    _OpCodePresets = {'geometry':       [5, 52, 53, 67, 68, 69, 70, 71, 72, 84, 85, 86, 89],
+                      'palettes':       [32, 64, 67, 68, 69, 70, 71, 83, 90, 93, 97, 102, 112, 113, 114, 128, 129, 133, 148],
+                      'hierarchy-only': [2, 4, 14, 33, 49, 55, 60, 63, 73, 74, 76, 78, 79, 80, 81, 82, 94, 96, 98, 105, 106, 107, 108, 109]}
+    # Records that hold the tree together, and padding, are never skipped
+    _StructuralOpCodes = [0, 10, 11, 19, 20, 21, 22, 61, 62]
+    # Push and pop records, which are skipped in pairs when the record they follow was skipped
+    _PushOpCodes = frozenset([10, 19, 21])
+    _PopOpCodes = frozenset([11, 20, 22])
+    # Records that describe the record before them, such as comments, transforms and bounding volumes,
+    # rather than starting a node of their own
+    _AncillaryOpCodes = frozenset([31, 33, 49, 52, 53, 60, 74, 76, 78, 79, 80, 81, 82, 94, 105, 106, 107, 108, 109])
+    # Fixed-size records are decoded in a single unpack. The tuple order for the
+    # layouts is (struct layout of the record body, field names, fields added by the handler).
+    # Indices are signed, so that unset ones read as -1.
+    _RecordLayouts = {  2:    (struct.Struct('>8sh2xIhhhB5xIff'),
+                               ['ASCIIID', 'RelativePriority', 'Flags', 'FXID1', 'FXID2', 'Significance', 'LayerCode', 'LoopCount', 'LoopDuration', 'LastFrameDuration'], []),
+                        4:    (struct.Struct('>8sIhHhhh2x'),
+                               ['ASCIIID', 'Flags', 'RelativePriority', 'Transparency', 'FXID1', 'FXID2', 'Significance'], []),
+                        5:    (struct.Struct('>8sIhB?HHxBhhhhhIhBBIB7xIIh2xii2xh'),
+                               ['ASCIIID', 'IRColCode', 'RelativePriority', 'DrawType', 'TextureWhite', 'ColourNameIdx', 'AltColourNameIdx', 'Template',
+                                'DetailTexturePatternIdx', 'TexturePatternIdx', 'MaterialIdx', 'SurfaceMaterialCode', 'FeatureID', 'IRMaterialCode',
+                                'Transparency', 'LODGenerationControl', 'LineStyleIdx', 'Flags', 'LightMode', 'PackedColour', 'AltPackedColour',
+                                'TextureMappingIdx', 'PrimaryColourIdx', 'AltColourIdx', 'ShaderIdx'], []),
+                       73:    (struct.Struct('>8s4xddhhI5d'),
+                               ['ASCIIID', 'SwitchInDistance', 'SwitchOutDistance', 'FXID1', 'FXID2', 'Flags', 'xCentre', 'yCentre', 'zCentre',
+                                'TransitionRange', 'SignificantSize'], []),
+                       84:    (struct.Struct('>8s4xIhB?HHxBhhhhhIHBBIB7xIIh2xii2xh'),
+                               ['ASCIIID', 'IRColourCode', 'RelativePriority', 'DrawType', 'TextureWhite', 'ColourNameIdx', 'AltColourNameIdx', 'Template',
+                                'DetailTexturePatternIdx', 'TexturePatternIdx', 'MaterialIdx', 'SurfaceMaterialCode', 'FeatureID', 'IRMaterialCode',
+                                'Transparency', 'LODGenerationControl', 'LineStyleIdx', 'Flags', 'LightMode', 'PackedColour', 'AltPackedColour',
+                                'TextureMappingIdx', 'PrimaryColourIdx', 'AltColourIdx', 'ShaderIdx'], []),
+                      111:    (struct.Struct('>8sHHII4f4I8f4xfI9fiI3f'),
+                               ['ASCIIID', 'SurfaceMaterialCode', 'FeatureID', 'BackColourBiDir', 'DisplayMode', 'Intensity', 'BackIntensity',
+                                'MinimumDefocus', 'MaximumDefocus', 'FadingMode', 'FogPunchMode', 'DirectionalMode', 'RangeMode', 'MinPixelSize',
+                                'MaxPixelSize', 'ActualSize', 'TransparentFalloffPixelSize', 'TransparentFalloffExponent', 'TransparentFalloffScalar',
+                                'TransparentFalloffClamp', 'FogScalar', 'SizeDifferenceThreshold', 'Directionality', 'HorizontalLobeAngle',
+                                'VerticalLobeAngle', 'LobeRollAngle', 'DirectionalFalloffExponent', 'DirectionalAmbientIntensity', 'AnimationPeriod',
+                                'AnimationPhaseDelay', 'AnimationEnabledPeriod', 'Significance', 'CalligraphicDrawOrder', 'Flags',
+                                'AxisOfRotationi', 'AxisOfRotationj', 'AxisOfRotationk'],
+                               ['AxisOfRotation'])}
+    # Vertex palette records can be decoded in bulk. The tuple order for these is
+    # (structured dtype of the whole record, datatype of a single vertex)
+    _VertexDtypes = {  68:    (np.dtype([('OpCode', '>i2'), ('Length', '>u2'), ('ColourNameIdx', '>u2'), ('Flags', '>u2'), ('Coordinate', '>f8', 3),
+                                         ('PackedColour', '>u4'), ('VertexColourIndex', '>u4')]),
+                               'VertexColour'),
+                       69:    (np.dtype([('OpCode', '>i2'), ('Length', '>u2'), ('ColourNameIdx', '>u2'), ('Flags', '>u2'), ('Coordinate', '>f8', 3),
+                                         ('Normal', '>f4', 3), ('PackedColour', '>u4'), ('VertexColourIndex', '>u4'), ('Reserved', 'V4')]),
+                               'VertexColourWithNormal'),
+                       70:    (np.dtype([('OpCode', '>i2'), ('Length', '>u2'), ('ColourNameIdx', '>u2'), ('Flags', '>u2'), ('Coordinate', '>f8', 3),
+                                         ('Normal', '>f4', 3), ('TextureCoordinate', '>f4', 2), ('PackedColour', '>u4'), ('VertexColourIndex', '>u4'),
+                                         ('Reserved', 'V4')]),
+                               'VertexColourWithNormalUV'),
+                       71:    (np.dtype([('OpCode', '>i2'), ('Length', '>u2'), ('ColourNameIdx', '>u2'), ('Flags', '>u2'), ('Coordinate', '>f8', 3),
+                                         ('TextureCoordinate', '>f4', 2), ('PackedColour', '>u4'), ('VertexColourIndex', '>u4')]),
+                               'VertexColourWithUV')}
+    # Local vertex pool dtypes, keyed by attribute mask
+    _LocalVertexDtypes = dict()
+    
+    def __init__(self, fileName = None, verbose = False, parent = None, tabbing = 0, memoryMap = False, bulkVertices = False, compactRecords = False, faceTable = False, externalWorkers = None, externalCache = None, cacheDirectory = None, textureWorkers = None, instrument = False, progress = None, progressInterval = 10000, resolver = None):
+        # The file name, data or file object to read
         self.fileName = fileName
         self.f = None
+        # File objects given by the caller are left open
+        self._OwnsFile = False
+        # When memory mapping, or reading data held in memory, the whole file is decoded from _Buffer at _Offset
+        self._memoryMap = memoryMap
+        self._Buffer = None
+        self._verbose = verbose
+        self._parent = parent
+        self._tabbing = tabbing
+        # Vertices are decoded in runs straight into the vertex store, rather than also being added to the tree one by one
+        self._bulkVertices = bulkVertices
+        self._compactRecords = compactRecords
+        self._faceTable = faceTable
+        # External references and texture attribute files are looked up with this callable
+        # first, if given. It is passed the name stored in the file and 'external' or
+        # 'texture', and returns a file name, data or file object, or None to use the file.
+        self._resolver = resolver
+        # External references are read after the file by a pool of this many processes.
+        # A resolver may not be usable in another process, so it turns the pool off.
+        self._externalWorkers = externalWorkers
+        self._deferExternal = externalWorkers is not None and resolver is None
+        # External references and textures are kept between reads in this cache,
+        # if given. Pass True to use the cache shared across the process.
+        if externalCache is True:
+            externalCache = SharedExternalCache
+        self._externalCache = externalCache
+        # Parsed files are saved to and loaded from this directory, if given
+        self._cacheDirectory = cacheDirectory
+        # Texture attribute files are parsed by a pool of this many threads
+        self._textureWorkers = textureWorkers
+        self._TexturePool = None
+        # Per-opcode timings and counters are gathered when instrumenting
+        self._instrument = instrument
+        # The progress callback is given the bytes read, file size (None when compressed), records
+        # read and records per second, every progressInterval records and once the read is done
+        if progressInterval < 1:
+            raise ValueError('The progress interval must be at least one record.')
+        self._progress = progress
+        self._progressInterval = progressInterval
+        # The handlers of this class, which may override those in _OpCodes
+        self._Handlers = _dispatchTable(self.__class__)
+        self.Reset()
+    
+    def Reset(self):
+        """
+            Discards everything read from the previous file, so that this
+            reader can be used for another one. The options given to the
+            reader are kept, as are the file name and any external cache.
+        """
+        self._close()
+        self._closeTexturePool()
+        self._BufferSize = 0
+        self._Offset = 0
         self.DBName = ""
         self.PrimaryNodeID = dict()
         self.Settings = dict()
         self._LastPlace = None
-        # The tuple order for OpCodes is (op_function, size, friendly name)
-        self._OpCodes = {   0:    (self._opReserved, None, 'padding'),
-                            1:    (self._opHeader, 324, 'header'),
-                            2:    (self._opGroup, 44, 'group'),
-                            4:    (self._opObject, 28, 'object'),
-                            5:    (self._opFace, 80, 'face'),
-                           10:    (self._opPush, 4, 'push'),
-                           11:    (self._opPop, 4, 'pop'),
-                           14:    (self._opDoF, 384, 'degree of freedom'),
-                           19:    (self._opPushSubface, 4, 'push subface'),
-                           20:    (self._opPopSubface, 4, 'pop subface'),
-                           21:    (self._opPushExtension, 24, 'push extension'),
-                           22:    (self._opPopExtension, 24, 'pop extension'),
-                           23:    (self._opContinuation, None, 'continuation'),
-                           31:    (self._opComment, None, 'comment'),
-                           32:    (self._opColourPalette, None, 'colour palette'),
-                           33:    (self._opLongID, None, 'long ID'),
-                           49:    (self._opMatrix, 68, 'matrix'),
-                           50:    (self._opVector, 16, 'vector'),
-                           52:    (self._opMultitexture, None, 'multitexture'),
-                           53:    (self._opUVList, 8, 'UV list'),
-                           55:    (self._opBSP, 48, 'binary separating plane'),
-                           60:    (self._opReplicate, 8, 'replicate'),
-                           61:    (self._opInstRef, 8, 'instance reference'),
-                           62:    (self._opInstDef, 8, 'instance definition'),
-                           63:    (self._opExtRef, 216, 'external reference'),
-                           64:    (self._opTexturePalette, 216, 'texture palette'),
-                           67:    (self._opVertexPalette, 8, 'vertex palette'),
-                           68:    (self._opVertexColour, 40, 'vertex with colour'),
-                           69:    (self._opVertexColNorm, 56, 'vertex with colour and normal'),
-                           70:    (self._opVertexColNormUV, 64, 'vertex with colour, normal and UV'),
-                           71:    (self._opVertexColUV, 48, 'vertex with colour and UV'),
-                           72:    (self._opVertexList, None, 'vertex list'),
-                           73:    (self._opLoD, 80, 'level of detail'),
-                           74:    (self._opBoundingBox, 52, 'bounding box'),
-                           76:    (self._opRotEdge, 64, 'rotate about edge'),
-                           78:    (self._opTranslate, 56, 'translate'),
-                           79:    (self._opScale, 48, 'scale'),
-                           80:    (self._opRotPoint, 48, 'rotate about point'),
-                           81:    (self._opRotScPoint, 96, 'rotate and/or scale to point'),
-                           82:    (self._opPut, 152, 'put'),
-                           83:    (self._opEyeTrackPalette, 4008, 'eyepoint and trackplane palette'),
-                           84:    (self._opMesh, 84, 'mesh'),
-                           85:    (self._opLocVertexPool, None, 'local vertex pool'),
-                           86:    (self._opMeshPrim, None, 'mesh primitive'),
-                           87:    (self._opRoadSeg, 12, 'road segment'),
-                           88:    (self._opRoadZone, 176, 'road zone'),
-                           89:    (self._opMorphVertex, None, 'morph vertex list'),
-                           90:    (self._opLinkPalette, None, 'linkage palette'),
-                           91:    (self._opSound, 88, 'sound'),
-                           92:    (self._opRoadPath, 632, 'road path'),
-                           93:    (self._opSoundPalette, None, 'sound palette'),
-                           94:    (self._opGenMatrix, 68, 'general matrix'),
-                           95:    (self._opText, 320, 'text'),
-                           96:    (self._opSwitch, None, 'switch'),
-                           97:    (self._opLineStylePalette, 12, 'line style palette'),
-                           98:    (self._opClipRegion, 280, 'clip region'),
-                          100:    (self._opExtension, None, 'extension'),
-                          101:    (self._opLightSrc, 64, 'light source'),
-                          102:    (self._opLightSrcPalette, 240, 'light source palette'),
-                          103:    (self._opReserved, None, 'reserved'),
-                          104:    (self._opReserved, None, 'reserved'),
-                          105:    (self._opBoundSphere, 16, 'bounding sphere'),
-                          106:    (self._opBoundCylinder, 24, 'bounding cylinder'),
-                          107:    (self._opBoundConvexHull, None, 'bounding convex hull'),
-                          108:    (self._opBoundVolCentre, 32, 'bounding volume centre'),
-                          109:    (self._opBoundVolOrientation, 32, 'bounding volume orientation'),
-                          110:    (self._opReserved, None, 'reserved'),
-                          111:    (self._opLightPt, 156, 'light point'),
-                          112:    (self._opTextureMapPalette, None, 'texture mapping palette'),
-                          113:    (self._opMatPalette, 84, 'material palette'),
-                          114:    (self._opNameTable, None, 'name table'),
-                          115:    (self._opCAT, 80, 'continuously adaptive terrain (CAT)'),
-                          116:    (self._opCATData, None, 'CAT data'),
-                          117:    (self._opReserved, None, 'reserved'),
-                          118:    (self._opReserved, None, 'reserved'),
-                          119:    (self._opBoundHist, None, 'bounding histogram'),
-                          120:    (self._opReserved, None, 'reserved'),
-                          121:    (self._opReserved, None, 'reserved'),
-                          122:    (self._opPushAttr, 8, 'push attribute'),
-                          123:    (self._opPopAttr, 4, 'pop attribute'),
-                          124:    (self._opReserved, None, 'reserved'),
-                          125:    (self._opReserved, None, 'reserved'),
-                          126:    (self._opCurve, None, 'curve'),
-                          127:    (self._opRoadConstruc, 168, 'road construction'),
-                          128:    (self._opLightPtAppearPalette, 412, 'light point appearance palette'),
-                          129:    (self._opLightPtAnimatPalette, None, 'light point animation palette'),
-                          130:    (self._opIdxLightPt, 28, 'indexed light point'),
-                          131:    (self._opLightPtSys, 24, 'light point system'),
-                          132:    (self._opIdxStr, None, 'indexed string'),
-                          133:    (self._opShaderPalette, None, 'shader palette'),
-                          134:    (self._opReserved, None, 'reserved'),
-                          135:    (self._opExtMatHdr, 28, 'extended material header'),
-                          136:    (self._opExtMatAmb, 48, 'extended material ambient'),
-                          137:    (self._opExtMatDif, 48, 'extended material diffuse'),
-                          138:    (self._opExtMatSpc, 48, 'extended material specular'),
-                          139:    (self._opExtMatEms, 48, 'extended material emissive'),
-                          140:    (self._opExtMatAlp, 44, 'extended material alpha'),
-                          141:    (self._opExtMatLightMap, 16, 'extended material light map'),
-                          142:    (self._opExtMatNormMap, 12, 'extended material normal map'),
-                          143:    (self._opExtMatBumpMap, 20, 'extended material bump map'),
-                          144:    (self._opReserved, None, 'reserved'),
-                          145:    (self._opExtMatShadowMap, 16, 'extended material shadow map'),
-                          146:    (self._opReserved, None, 'reserved'),
-                          147:    (self._opExtMatReflMap, 32, 'extended material reflection map'),
-                          148:    (self._opExtGUIDPalette, 48, 'extension GUID palette'),
-                          149:    (self._opExtFieldBool, 12, 'extension field boolean'),
-                          150:    (self._opExtFieldInt, 12, 'extension field integer'),
-                          151:    (self._opExtFieldFloat, 12, 'extension field float'),
-                          152:    (self._opExtFieldDouble, 16, 'extension field double'),
-                          153:    (self._opExtFieldString, None, 'extension field string'),
-                          154:    (self._opExtFieldXMLString, None, 'extension field XML string record')}
-        self._ObsoleteOpCodes = [3, 6, 7, 8, 9, 12, 13, 16, 17, 40, 41, 42, 43, 44, 45, 46, 47, 48, 51, 65, 66, 77]
+        self._SkipOpCodes = set()
+        # Whether the last record that starts a node was skipped, and whether each open level was skipped
+        self._ParentSkipped = False
+        self._SkippedLevels = []
+        # Decoded objects waiting to be yielded when streaming records
+        self._Events = None
+        self._CurrentOpCode = None
         self._PreviousOpCode = 0
         
         self.Records = dict()
         self.Records["Tree"] = []
         self.Records["Instances"] = dict()
         self.Records["External"] = dict()
-        self.Records["Vertices"] = dict()
-        self.Records["VertexList"] = []
+        self.Records["Vertices"] = VertexStore()
+        # The texture coordinate of each vertex, or None, filled in from the vertex store once the file has been read
         self.Records["VertexUV"] = []
+        self.Records["VertexList"] = []
         self.Records["Textures"] = []
+        self.Records["Faces"] = FaceTable()
+        self.Records["TexturePatterns"] = []
         self._RecordType = 'Tree'
-        self._TreeStack = []
+        self._TreeStack = [self.Records["Tree"]]
         self._InstanceStack = []
         self._Chunk = None
-        self._verbose = verbose
-        self._parent = parent
-        self._tabbing = tabbing
+        self._ChunkOffset = 0
+        self._PendingExternal = []
+        self._PendingTextures = dict()
+        self._Stats = None
+        self._logRecords = False
+        self._FileSize = 0
+        # The external references and textures named by this file, in order
+        self._References = []
         self._VertexCounter = 0
         self._TexturePatternIdx = None
-        self.Records["TexturePatterns"] = []
+        if hasattr(self, 'e'):
+            del self.e
     
-    def _readString(self, size, fromChunk = False):
-        if fromChunk:
-            data = self._Chunk[:size]
-            self._Chunk = self._Chunk[size:]
+    def Load(self, fileName, include = None, exclude = None):
+        """
+            Resets the reader and reads another file with the same options,
+            returning its records. As with ReadFile, any error is stored in
+            self.e. The records of the previous file are not reused, so they
+            remain valid after this call.
+        """
+        self.Reset()
+        self.fileName = fileName
+        self.ReadFile(include = include, exclude = exclude)
+        return self.Records
+    
+    def _open(self, fileName):
+        """
+            Opens a file name, data or file object for reading. Data held in
+            memory is decoded in place. When memory mapping has been requested,
+            the whole file is mapped once and decoded in place too.
+            An internal function.
+        """
+        self._Offset = 0
+        compression = _compression(fileName)
+        if compression is not None:
+            # Compressed files are decompressed in chunks as they are read, rather than memory mapped
+            self.f = _openCompressed(fileName, compression)
+            self._OwnsFile = True
+            return
+        if not _isPath(fileName) and not hasattr(fileName, 'read'):
+            self._Buffer = _sourceBuffer(fileName)
+            self._BufferSize = len(self._Buffer)
+            return
+        self._OwnsFile = _isPath(fileName)
+        self.f = open(fileName, 'rb') if self._OwnsFile else fileName
+        if self._memoryMap:
+            try:
+                self._Buffer = mmap.mmap(self.f.fileno(), 0, access = mmap.ACCESS_READ)
+            except (AttributeError, ValueError, EnvironmentError):
+                if self._OwnsFile:
+                    raise
+                # File objects without a file descriptor are read as a stream
+                return
+            self._BufferSize = len(self._Buffer)
+    
+    def _isOpen(self):
+        """
+            Returns whether a file or data is open for reading.
+            An internal function.
+        """
+        return self.f is not None or self._Buffer is not None
+    
+    def _close(self):
+        """
+            Closes the file and releases any memory map. File objects given
+            by the caller are not closed.
+            An internal function.
+        """
+        if self._Buffer is not None:
+            if isinstance(self._Buffer, mmap.mmap):
+                self._Buffer.close()
+            self._Buffer = None
+        if self.f is not None:
+            if self._OwnsFile:
+                self.f.close()
+            self.f = None
+    
+    def _tell(self):
+        if self._Buffer is not None:
+            return self._Offset
+        return self.f.tell()
+    
+    def _seek(self, position):
+        if self._Buffer is not None:
+            self._Offset = position
         else:
-            data =  self.f.read(size)
-        return struct.unpack('>' + str(size) + 's', data)[0].replace('\x00', '')
+            self.f.seek(position)
     
-    def _readFloat(self, fromChunk = False):
+    def _unpack(self, layout, fromChunk = False):
+        """
+            Decodes a precompiled struct layout at the current position
+            and returns the tuple of values.
+            An internal function.
+        """
         if fromChunk:
-            data = self._Chunk[:4]
-            self._Chunk = self._Chunk[4:]
-        else:
-            data = self.f.read(4)
-        return struct.unpack('>f', data)[0]
+            values = layout.unpack_from(self._Chunk, self._ChunkOffset)
+            self._ChunkOffset += layout.size
+            return values
+        if self._Buffer is not None:
+            values = layout.unpack_from(self._Buffer, self._Offset)
+            self._Offset += layout.size
+            return values
+        return layout.unpack(self.f.read(layout.size))
+    
+    def _readRecord(self, opCode):
+        """
+            Decodes the body of a fixed-size record with its precompiled layout
+            and returns a dictionary of the named fields, or a compact Record
+            when compact records have been requested.
+            An internal function.
+        """
+        layout, varNames, extraNames = self._RecordLayouts[opCode]
+        if self._compactRecords:
+            recordClass = _recordClass(self._OpCodes[opCode][2], varNames + extraNames)
+            return recordClass(varNames, self._unpack(layout))
+        return dict(zip(varNames, self._unpack(layout)))
     
-    def _readDouble(self, fromChunk = False):
+    def _readArray(self, dtype, count, fromChunk = False):
+        """
+            Reads count consecutive values of the given big-endian dtype in
+            one go and returns them as a native byte order array.
+            An internal function.
+        """
+        dtype = np.dtype(dtype)
         if fromChunk:
-            data = self._Chunk[:8]
-            self._Chunk = self._Chunk[8:]
+            values = np.frombuffer(self._Chunk, dtype = dtype, count = count, offset = self._ChunkOffset)
+            self._ChunkOffset += count * dtype.itemsize
+        elif self._Buffer is not None:
+            values = np.frombuffer(self._Buffer, dtype = dtype, count = count, offset = self._Offset)
+            self._Offset += count * dtype.itemsize
         else:
-            data = self.f.read(8)
-        return struct.unpack('>d', data)[0]
+            values = np.frombuffer(self.f.read(count * dtype.itemsize), dtype = dtype, count = count)
+        # Converting also copies the values out of the file buffer
+        return values.astype(dtype.newbyteorder('='))
     
-    def _readUShort(self, fromChunk = False):
+    def _readBytes(self, size, fromChunk = False):
         if fromChunk:
-            data = self._Chunk[:2]
-            self._Chunk = self._Chunk[2:]
+            data = self._Chunk[self._ChunkOffset:self._ChunkOffset + size]
+            self._ChunkOffset += size
+        elif self._Buffer is not None:
+            data = self._Buffer[self._Offset:self._Offset + size]
+            self._Offset += size
         else:
-            data = self.f.read(2)
-        return struct.unpack('>H', data)[0]
+            data = self.f.read(size)
+        return data
+    
+    def _readString(self, size, fromChunk = False):
+        data = self._readBytes(size, fromChunk)
+        return struct.unpack('>' + str(size) + 's', data)[0].replace('\x00', '')
+    
+    def _readFloat(self, fromChunk = False):
+        return self._unpack(_Float, fromChunk)[0]
+    
+    def _readDouble(self, fromChunk = False):
+        return self._unpack(_Double, fromChunk)[0]
+    
+    def _readUShort(self, fromChunk = False):
+        return self._unpack(_UShort, fromChunk)[0]
     
     def _readShort(self, fromChunk = False):
-        if fromChunk:
-            data = self._Chunk[:2]
-            self._Chunk = self._Chunk[2:]
-        else:
-            data = self.f.read(2)
-        return struct.unpack('>h', data)[0]
+        return self._unpack(_Short, fromChunk)[0]
     
     def _readUInt(self, fromChunk = False):
-        if fromChunk:
-            data = self._Chunk[:4]
-            self._Chunk = self._Chunk[4:]
-        else:
-            data = self.f.read(4)
-        return struct.unpack('>I', data)[0]
+        return self._unpack(_UInt, fromChunk)[0]
     
     def _readInt(self, fromChunk = False):
-        if fromChunk:
-            data = self._Chunk[:4]
-            self._Chunk = self._Chunk[4:]
-        else:
-            data = self.f.read(4)
-        return struct.unpack('>i', data)[0]
+        return self._unpack(_Int, fromChunk)[0]
     
     def _readBool(self, fromChunk = False):
-        if fromChunk:
-            data = self._Chunk[:1]
-            self._Chunk = self._Chunk[1:]
-        else:
-            data = self.f.read(1)
-        return struct.unpack('>?', data)[0]
+        return self._unpack(_Bool, fromChunk)[0]
     
     def _readUChar(self, fromChunk = False):
-        if fromChunk:
-            data = self._Chunk[:1]
-            self._Chunk = self._Chunk[1:]
-        else:
-            data = self.f.read(1)
-        return struct.unpack('>B', data)[0]
+        return self._unpack(_UChar, fromChunk)[0]
     
     def _readSChar(self, fromChunk = False):
-        if fromChunk:
-            data = self._Chunk[:1]
-            self._Chunk = self._Chunk[1:]
-        else:
-            data = self.f.read(1)
-        return struct.unpack('>b', data)[0]
+        return self._unpack(_SChar, fromChunk)[0]
     
     def _readChar(self, fromChunk = False):
-        if fromChunk:
-            data = self._Chunk[:1]
-            self._Chunk = self._Chunk[1:]
-        else:
-            data = self.f.read(1)
-        return struct.unpack('>c', data)[0]
+        return self._unpack(_Char, fromChunk)[0]
+    
+    def _readOpCode(self):
+        """
+            Reads the next opcode, returning None at the end of the file.
+            An internal function.
+        """
+        if self._Buffer is not None:
+            if self._Offset + 2 > self._BufferSize:
+                return None
+            return self._readShort()
+        data = self.f.read(2)
+        if len(data) < 2:
+            return None
+        return _Short.unpack(data)[0]
+    
+    def _chunkRemaining(self):
+        """
+            Returns the number of bytes left to decode in the current chunk.
+            An internal function.
+        """
+        return len(self._Chunk) - self._ChunkOffset
     
     def _skip(self, noBytes, fromChunk = False):
         if fromChunk:
-            self._Chunk = self._Chunk[noBytes:]
+            self._ChunkOffset += noBytes
+        elif self._Buffer is not None:
+            self._Offset += noBytes
         else:
             self.f.seek(noBytes, os.SEEK_CUR)
     
     def _check_filesize(self, fileName):
-        fileSize = os.stat(fileName).st_size
+        fileSize = _sourceSize(fileName)
         
-        if fileSize % 4 > 0:
+        # The size of compressed files is not known until they have been read
+        if fileSize is not None and fileSize % 4 > 0:
             return False
         return True
     
     def _check_header(self, fileName):
         recognisableRecordTypes = [0x01]
         recognisableRecordSizes = [324]
-        if self.f is None:
-            self.f = open(fileName, 'rb')
+        if not self._isOpen():
+            self._open(fileName)
         # Ensure we're at the start of the file
-        self.f.seek(0)
+        self._seek(0)
         
-        print '\t' * self._tabbing + "Determining record type... ",
+        _log.debug("Determining record type of %s", _describeSource(fileName))
         iRead = self._readShort()
         
         recognised = [iRead == this for this in recognisableRecordTypes]
@@ -285,50 +1439,50 @@ class OpenFlight:
         if not any(recognised):
             raise Exception("Unidentifiable record type")
         
-        print "\r" + '\t' * self._tabbing + "Determining record length... ",
+        _log.debug("Determining record length")
         recordLength = self._readUShort()
         
         if recordLength != recognisableRecordSizes[recognised.index(True)]:
             raise Exception("Unexpected record length.")
         
-        print "\r" + '\t' * self._tabbing + "Reading record name... ",
+        _log.debug("Reading record name")
         
         self.DBName  = self._readString(8)
         
-        print "\r" + '\t' * self._tabbing + "Read database name \"" + self.DBName + "\"\n"
+        _log.info("Read database name \"%s\"", self.DBName)
         
-        print '\t' * self._tabbing + "Determining file format revision number... ",
+        _log.debug("Determining file format revision number")
         iRead = self._readInt()
         
         if iRead not in self._OpenFlightFormats:
             raise Exception("Unrecognised OpenFlight file format revision number.")
-        print "\r" '\t' * self._tabbing + "Database is written in the " + self._OpenFlightFormats[iRead] + " file format.\n"
+        _log.info("Database is written in the %s file format", self._OpenFlightFormats[iRead])
         
         # We're not interested in the edit revision number, so skip that:
         self._skip(4)
         
-        print '\t' * self._tabbing + "Determining date and time of last revision... ",
+        _log.debug("Determining date and time of last revision")
         
         # Next up is the date and time of the last revision
         iRead = self._readString(32)
         
-        print "\r" + '\t' * self._tabbing + "Recorded date and time of last revision: " + iRead + "\n"
+        _log.info("Recorded date and time of last revision: %s", iRead)
         
-        print '\t' * self._tabbing + "Extracting Node ID numbers... ",
+        _log.debug("Extracting Node ID numbers")
         
         self.PrimaryNodeID['Group'] = self._readUShort()
         self.PrimaryNodeID['LOD'] = self._readUShort()
         self.PrimaryNodeID['Object'] = self._readUShort()
         self.PrimaryNodeID['Face'] = self._readUShort()
         
-        print "\r" + '\t' * self._tabbing + "Validating unit multiplier... ",
+        _log.debug("Validating unit multiplier")
         
         iRead = self._readUShort()
         
         if iRead != 1:
             raise Exception("Unexpected value for unit multiplier.")
         
-        print "\r" + '\t' * self._tabbing + "Extracting scene settings... ",
+        _log.debug("Extracting scene settings")
         
         iRead = self._readUChar()
         
@@ -454,99 +1608,594 @@ class OpenFlight:
                 raise IOError('No filename specified.')
             fileName = self.fileName
             
-        if not os.path.exists(fileName):
+        if _isPath(fileName) and not os.path.exists(fileName):
             raise IOError('Could not find file.')
         
         checkList = [False] * len(self._Checks)
         
         try:
             for funcIdx, func in enumerate(self._Checks):
-                checkList[funcIdx] = func(fileName)
-            self._LastPlace = self.f.tell()
+                checkList[funcIdx] = func(self, fileName)
+            self._LastPlace = self._tell()
         except BaseException, e:
-            print('\t' * self._tabbing + "An error occurred when calling " + str(func) + ".")
-            print('\t' * self._tabbing + str(e))
+            _log.error("An error occurred when calling %s: %s", func.__name__, e)
         finally:
-            if self.f is not None:
-                self.f.close()
-                self.f = None
+            self._close()
         
         if not all(checkList):
-            print "\n" + '\t' * self._tabbing + "The following errors were encountered:\n"
             messages = [message for msgIdx, message in enumerate(self._ErrorMessages) if not checkList[msgIdx]]
             for message in messages:
-                print '\t' * self._tabbing + message
-            print "\n"
+                _log.error("%s: %s", _describeSource(fileName), message)
             return False
         else:
-            print "\n" + '\t' * self._tabbing + "This file conforms to OpenFlight standards\n"
+            _log.info("%s conforms to OpenFlight standards", _describeSource(fileName))
             return True
     
-    def ReadFile(self, fileName = None):
+    def ReadFile(self, fileName = None, include = None, exclude = None):
+        """
+            Reads the OpenFlight file into self.Records.
+            
+            Decoding can be limited with include and exclude, each given as a
+            collection of opcodes, a preset name ('geometry', 'palettes' or
+            'hierarchy-only') or a mix of the two. Records that are not decoded
+            are skipped using their length field. Instance records are always
+            decoded. A push record is skipped along with its pop when the record
+            it follows was skipped, so the records nested under a skipped record
+            join the level above rather than leaving an empty level behind.
+            
+            The file can be given as a file name, as data held in memory (a
+            bytearray, buffer, memoryview or string) or as a seekable binary
+            file object, which is read from its start and left open. Data is
+            decoded in place without being copied. Relative external references
+            are found next to a named file, or through the resolver.
+            
+            Files compressed with gzip, bz2 or xz are recognised by their first
+            bytes and decompressed in chunks as they are read. External
+            references are also found with a .gz, .bz2 or .xz suffix. Reading xz
+            files needs the lzma module.
+            
+            When a cache directory has been given, the records are loaded from
+            there if the file and its external references are unchanged, and
+            saved there otherwise. Only named files read without a resolver are
+            cached.
+        """
+        fileName = self._beginRead(fileName, include, exclude)
+        name = _describeSource(fileName)
+        useCache = self._cacheDirectory is not None and _isPath(fileName) and self._resolver is None
+        
+        # Pick the dispatch function once, so that instrumentation costs nothing when disabled
+        processRecord = self._processRecordInstrumented if self._instrument else self._processRecord
+        gcEnabled = gc.isenabled()
+        
+        try:
+            if useCache and self._loadCache(fileName):
+                _log.info("Loaded %s from the parse cache", name)
+                return
+            if self._instrument and _PauseCollections:
+                # Collections would reset the allocation counters
+                gc.disable()
+            if self._progress is None:
+                while processRecord() is not None:
+                    pass
+            else:
+                self._readWithProgress(processRecord)
+            self._endRead()
+            if useCache:
+                self._saveCache(fileName)
+            _log.info("Finished reading %s", name)
+        except BaseException, e:
+            if self._CurrentOpCode not in self._OpCodes:
+                _log.error("An error occurred when calling Opcode %s in %s: %s", self._CurrentOpCode, name, e)
+            else:
+                _log.error("An error occurred when calling Opcode %s (%s) in %s: %s", self._CurrentOpCode, self._OpCodes[self._CurrentOpCode][2], name, e)
+            self.e = e
+        finally:
+            # Close nicely.
+            self._close()
+            self._closeTexturePool()
+            if gcEnabled:
+                gc.enable()
+    
+    def IterRecords(self, fileName = None, include = None, exclude = None):
+        """
+            Reads the OpenFlight file as a stream, yielding an (event, opcode,
+            depth, record) tuple as each record is decoded. The event is 'record'
+            for a decoded record, and 'enter' or 'exit' (with a record of None)
+            for push and pop records.
+            
+            The tree is not built in self.Records, so memory use does not grow
+            with the number of records. The vertex store is still filled so that
+            vertex list byte offsets can be resolved, and instance definitions are
+            kept so that instance references can be yielded. The include and
+            exclude arguments are as for ReadFile. Errors are raised rather than
+            stored.
+        """
+        self._beginRead(fileName, include, exclude)
+        self._Events = []
+        
+        processRecord = self._processRecordInstrumented if self._instrument else self._processRecord
+        gcEnabled = gc.isenabled()
+        
+        try:
+            if self._instrument and _PauseCollections:
+                # As for ReadFile, collections would reset the allocation counters
+                gc.disable()
+            depth = 0
+            while processRecord() is not None:
+                for event, record in self._Events:
+                    if event == 'exit':
+                        depth -= 1
+                    yield event, self._CurrentOpCode, depth, record
+                    if event == 'enter':
+                        depth += 1
+                del self._Events[:]
+            self._endRead()
+        finally:
+            self._Events = None
+            self._close()
+            self._closeTexturePool()
+            if gcEnabled:
+                gc.enable()
+    
+    def _beginRead(self, fileName, include, exclude):
+        """
+            Validates and opens the file, positions it after the header and
+            sets up any opcode filters and statistics. Returns the file name.
+            An internal function.
+        """
         # Number of checks to perform
         if fileName is None:
             if self.fileName is None:
                 raise IOError('No filename specified.')
             fileName = self.fileName
         
-        print('\n' + '\t' * self._tabbing +  'File to open: ' + fileName + '\n')
-        
-        if not os.path.exists(fileName):
+        self._SkipOpCodes = set()
+        self._ParentSkipped = False
+        self._SkippedLevels = []
+        self._PendingExternal = []
+        self._References = []
+        self._PendingTextures = dict()
+        if self._instrument:
+            self._Stats = {'OpCodes': dict(), 'Sections': dict()}
+        if include is not None:
+            self._SkipOpCodes = set(self._OpCodes) - self._resolveOpCodes(include)
+        if exclude is not None:
+            self._SkipOpCodes |= self._resolveOpCodes(exclude)
+        self._SkipOpCodes -= set(self._StructuralOpCodes)
+        
+        _log.info("File to open: %s", _describeSource(fileName))
+        
+        if _isPath(fileName) and not os.path.exists(fileName):
             raise IOError('Could not find file.')
         
         if self._LastPlace is None:
             if not self.isOpenFlight(fileName):
                 raise Exception("Unable to continue. File does not conform to OpenFlight standards.")
         
-        if self.f is None:
-            self.f = open(fileName, 'rb')
+        if not self._isOpen():
+            self._open(fileName)
         
         # We can skip past the header and start reading stuff...
-        self.f.seek(self._LastPlace)
+        self._seek(self._LastPlace)
         
-        # Reset the stacks
-        self._TreeStack = []
+        # Reset the stacks. These hold the nodes being filled, starting with the root of the tree.
+        self._TreeStack = [self.Records["Tree"]]
         self._InstanceStack = []
+        self._CurrentOpCode = None
+        
+        _log.info("Reading OpenFlight file %s", _describeSource(fileName))
+        # Only log every record when asked to, as it would slow the read considerably
+        self._logRecords = self._verbose and _log.isEnabledFor(logging.DEBUG)
+        self._FileSize = _sourceSize(fileName)
         
-        print '\t' * self._tabbing + "Reading OpenFlight file..."
+        return fileName
+    
+    def _processRecord(self):
+        """
+            Reads and decodes the next record. Returns its opcode, or None at
+            the end of the file.
+            An internal function.
+        """
+        iRead = self._readOpCode()
+        if iRead is None:
+            return None
+        self._CurrentOpCode = iRead
+        if self._logRecords:
+            _log.debug("Opcode read: %d", iRead)
+        if iRead in self._ObsoleteOpCodes:
+            raise Exception("Unable to continue. File uses obsolete codes.")
+        opCode = self._Handlers.get(iRead)
+        if opCode is None:
+            raise Exception("Unable to continue OpenFlight Opcode not recognised.")
+        # If here, there's a code that can be run.
+        # Determine whether we should check the size of the block
+        RecordLength = None
+        if opCode[1] is not None:
+            # There's a size we should check matches
+            RecordLength = self._readUShort()
+            if RecordLength != opCode[1]:
+                raise Exception("Unexpected " + opCode[2] + " record length")
+        if iRead in self._PushOpCodes:
+            # Remember whether this level is skipped, so that its pop is skipped too
+            skipped = self._ParentSkipped
+            self._SkippedLevels.append(skipped)
+            self._ParentSkipped = False
+        elif iRead in self._PopOpCodes:
+            skipped = self._SkippedLevels.pop() if self._SkippedLevels else False
+            self._ParentSkipped = False
+        else:
+            skipped = iRead in self._SkipOpCodes
+            if iRead not in self._AncillaryOpCodes:
+                self._ParentSkipped = skipped
+        if skipped:
+            self._skipRecord(iRead, RecordLength)
+        else:
+            # Handlers in the dispatch table are plain functions, so the reader is passed in
+            opCode[0](self)
         
+        # Lastly, save this Opcode:
+        self._PreviousOpCode = iRead
+        return iRead
+    
+    def _processRecordInstrumented(self):
+        """
+            Reads and decodes the next record as _processRecord does, adding
+            its time, size and allocations to the statistics for its opcode.
+            An internal function.
+        """
+        offset = self._tell()
+        allocations = _allocationCount()
+        start = timeit.default_timer()
+        iRead = self._processRecord()
+        elapsed = timeit.default_timer() - start
+        if iRead is None:
+            return None
+        
+        name = self._OpCodes[iRead][2]
+        if name not in self._Stats['OpCodes']:
+            self._Stats['OpCodes'][name] = {'OpCode': iRead, 'Count': 0, 'Bytes': 0, 'TotalSeconds': 0.0, 'MaxSeconds': 0.0, 'Allocations': 0}
+        entry = self._Stats['OpCodes'][name]
+        entry['Count'] += 1
+        entry['Bytes'] += self._tell() - offset
+        entry['TotalSeconds'] += elapsed
+        entry['MaxSeconds'] = max(entry['MaxSeconds'], elapsed)
+        entry['Allocations'] += _allocationCount() - allocations
+        return iRead
+    
+    def _addSectionTime(self, name, elapsed, byteCount = 0):
+        """
+            Adds the time spent in one part of the reader, such as continuation
+            records or external references, to the statistics.
+            An internal function.
+        """
+        if name not in self._Stats['Sections']:
+            self._Stats['Sections'][name] = {'Count': 0, 'Bytes': 0, 'TotalSeconds': 0.0, 'MaxSeconds': 0.0}
+        entry = self._Stats['Sections'][name]
+        entry['Count'] += 1
+        entry['Bytes'] += byteCount
+        entry['TotalSeconds'] += elapsed
+        entry['MaxSeconds'] = max(entry['MaxSeconds'], elapsed)
+    
+    def Statistics(self, asJSON = False):
+        """
+            Returns the statistics gathered by the last instrumented read, or
+            None if instrumentation was not enabled. OpCodes holds the count,
+            bytes consumed, total and maximum time and allocations of each
+            record type, keyed by name. The allocations are the net number of
+            memory blocks allocated where Python counts them, and otherwise of
+            new objects tracked by the garbage collector, in which case garbage
+            collection is paused for the whole process during the read, and
+            while iterating over IterRecords. Sections holds the
+            time spent assembling continuation records and reading external
+            references and texture attributes; apart from the worker pools
+            waited on at the end of the read, these are also included in the
+            time of the records that caused them.
+        """
+        if self._Stats is None:
+            return None
+        stats = dict(self._Stats)
+        stats['TotalSeconds'] = sum(entry['TotalSeconds'] for entry in self._Stats['OpCodes'].values())
+        stats['TotalBytes'] = sum(entry['Bytes'] for entry in self._Stats['OpCodes'].values())
+        if asJSON:
+            return json.dumps(stats, indent = 2, sort_keys = True)
+        return stats
+    
+    def _readWithProgress(self, processRecord):
+        """
+            Reads the remaining records, reporting progress to the callback
+            every progressInterval records and once at the end.
+            An internal function.
+        """
+        start = timeit.default_timer()
+        records = 0
+        while processRecord() is not None:
+            records += 1
+            if records % self._progressInterval == 0:
+                self._reportProgress(records, start)
+        self._reportProgress(records, start)
+    
+    def _reportProgress(self, records, start):
+        """
+            Passes the progress of the current read to the callback.
+            An internal function.
+        """
+        elapsed = timeit.default_timer() - start
+        self._progress(self._tell(), self._FileSize, records, records / elapsed if elapsed > 0 else 0.0)
+    
+    def _endRead(self):
+        """
+            Tidies up once every record has been read.
+            An internal function.
+        """
+        # Release the spare capacity of the vertex and face columns
+        self.Records['Vertices'].trim()
+        self.Records['Faces'].trim()
+        self.Records['VertexUV'] = self.Records['Vertices'].textureCoordinates()
+        # Read any external references that were collected for the worker pool
+        if self._externalWorkers is not None and self._PendingExternal:
+            start = timeit.default_timer()
+            self._readExternals()
+            if self._Stats is not None:
+                self._addSectionTime('ExternalReferencePool', timeit.default_timer() - start)
+        # Fill in the texture attributes parsed in the background
+        if self._PendingTextures:
+            start = timeit.default_timer()
+            self._collectTextures()
+            if self._Stats is not None:
+                self._addSectionTime('TextureAttributeWait', timeit.default_timer() - start)
+    
+    def _cacheEntry(self, fileName):
+        """
+            Returns the path, without extension, of the parse cache entry for
+            a file. The name depends on the file's path, size and modification
+            time, the library version and the read options.
+            An internal function.
+        """
+        info = os.stat(fileName)
+        key = repr((os.path.abspath(fileName), info.st_size, info.st_mtime, __version__, _CacheFormat,
+                    sorted(self._SkipOpCodes), self._bulkVertices, self._compactRecords, self._faceTable))
+        return os.path.join(self._cacheDirectory, hashlib.sha1(key).hexdigest())
+    
+    def _cacheDependencies(self):
+        """
+            Returns the modification time and size of each external reference
+            and texture attribute file that the records depend on.
+            An internal function.
+        """
+        dependencies = []
+        for fileName, records in self.Records['External'].items():
+            if isinstance(records, dict) and 'Tree' in records:
+                # External references are kept with the records of the file they name
+                if not os.path.exists(fileName):
+                    continue
+            else:
+                # Texture keys are the names stored in the file, so stamp the attribute file
+                try:
+                    fileName = self._checkTextureFile(fileName)
+                except IOError:
+                    continue
+            info = os.stat(fileName)
+            dependencies.append((fileName, info.st_size, info.st_mtime))
+        return dependencies
+    
+    def _saveCache(self, fileName):
+        """
+            Saves the records to the parse cache. Large arrays are written to a
+            data file so that they can be memory mapped when loaded, and the
+            rest of the records are pickled. Both files hold the same random
+            token, so that a data file is never used with the tree of another
+            save.
+            An internal function.
+        """
+        if hasattr(self, 'e'):
+            return
+        entry = self._cacheEntry(fileName)
+        token = os.urandom(_CacheTokenBytes)
         try:
-            while True:
-                iRead = self.f.read(2)
-                if iRead == '':
-                    break
-                # There's some data.
-                iRead = struct.unpack('>h', iRead)[0]
-                if self._verbose:
-                    print '\t' * self._tabbing + "Opcode read:", str(iRead)
-                if iRead in self._ObsoleteOpCodes:
-                    raise Exception("Unable to continue. File uses obsolete codes.")
-                if iRead not in self._OpCodes:
-                    raise Exception("Unable to continue OpenFlight Opcode not recognised.")
-                # If here, there's a code that can be run.
-                # Determine whether we should check the size of the block
-                if self._OpCodes[iRead][1] is not None:
-                    # There's a size we should check matches
-                    RecordLength = self._readUShort()
-                    if RecordLength != self._OpCodes[iRead][1]:
-                        raise Exception("Unexpected " + self._OpCodes[iRead][2] + " record length")
-                self._OpCodes[iRead][0]()
+            if not os.path.isdir(self._cacheDirectory):
+                os.makedirs(self._cacheDirectory)
+            dataFile = open(entry + '.data.tmp', 'wb')
+            treeFile = open(entry + '.tree.tmp', 'wb')
+            try:
+                dataFile.write(token)
+                def persistentId(obj):
+                    if type(obj) is not np.ndarray or obj.dtype.hasobject or obj.nbytes < _CacheArrayBytes:
+                        return None
+                    # Keep each array aligned within the data file
+                    offset = dataFile.tell()
+                    padding = -offset % 64
+                    dataFile.write('\x00' * padding)
+                    dataFile.write(np.ascontiguousarray(obj).tobytes())
+                    return ('array', offset + padding, obj.dtype, obj.shape)
                 
-                # Lastly, save this Opcode:
-                self._PreviousOpCode = iRead
-            print '\t' * self._tabbing + "Finished reading", fileName + "\n"
-        except BaseException, e:
-            if iRead not in self._OpCodes:
-                print('\t' * self._tabbing + "An error occurred when calling Opcode " + str(iRead) + ".")
+                pickler = cPickle.Pickler(treeFile, cPickle.HIGHEST_PROTOCOL)
+                # Only called for objects other than the built-in types, which keeps dumping fast
+                pickler.inst_persistent_id = persistentId
+                pickler.dump((token, self._cacheDependencies(), self.Records))
+            finally:
+                dataFile.close()
+                treeFile.close()
+            # Replace any previous entry in one step
+            os.rename(entry + '.data.tmp', entry + '.data')
+            os.rename(entry + '.tree.tmp', entry + '.tree')
+        except (IOError, OSError, cPickle.PicklingError, RuntimeError), e:
+            # Very deep trees exceed the recursion limit of the pickler. The read itself is fine.
+            _log.warning("Unable to save %s to the parse cache: %s", fileName, e)
+            for partFile in [entry + '.data.tmp', entry + '.tree.tmp']:
+                if os.path.exists(partFile):
+                    os.remove(partFile)
+    
+    def _loadCache(self, fileName):
+        """
+            Loads the records from the parse cache, returning False if there is
+            no entry for the file or any of its dependencies have changed. An
+            entry that cannot be loaded is removed, so that the file is parsed
+            and cached again.
+            An internal function.
+        """
+        entry = self._cacheEntry(fileName)
+        if not os.path.exists(entry + '.tree') or not os.path.exists(entry + '.data'):
+            return False
+        
+        try:
+            dependencies, records = self._loadCacheEntry(entry)
+        except (EOFError, cPickle.UnpicklingError, ValueError, IndexError, TypeError, IOError), e:
+            _log.warning("Discarding unreadable parse cache entry for %s: %s", fileName, e)
+            for partFile in [entry + '.data', entry + '.tree']:
+                try:
+                    os.remove(partFile)
+                except OSError:
+                    pass
+            return False
+        
+        for dependency, size, mtime in dependencies:
+            if not os.path.exists(dependency):
+                return False
+            info = os.stat(dependency)
+            if (info.st_size, info.st_mtime) != (size, mtime):
+                return False
+        
+        self.Records = records
+        self._TreeStack = [self.Records["Tree"]]
+        return True
+    
+    def _loadCacheEntry(self, entry):
+        """
+            Reads a parse cache entry and returns its dependencies and records,
+            raising an error if it is incomplete or if the data file
+            was written by another save than the tree.
+            An internal function.
+        """
+        dataFile = open(entry + '.data', 'rb')
+        try:
+            if os.fstat(dataFile.fileno()).st_size < _CacheTokenBytes:
+                raise EOFError('The parse cache data file is truncated.')
+            data = mmap.mmap(dataFile.fileno(), 0, access = mmap.ACCESS_READ)
+        finally:
+            dataFile.close()
+        
+        def persistentLoad(pid):
+            kind, offset, dtype, shape = pid
+            count = int(np.prod(shape))
+            return np.frombuffer(data, dtype = dtype, count = count, offset = offset).reshape(shape)
+        
+        treeFile = open(entry + '.tree', 'rb')
+        try:
+            unpickler = cPickle.Unpickler(treeFile)
+            unpickler.persistent_load = persistentLoad
+            token, dependencies, records = unpickler.load()
+        finally:
+            treeFile.close()
+        
+        if data[:_CacheTokenBytes] != token:
+            raise ValueError('The parse cache data file does not belong to the tree.')
+        return dependencies, records
+    
+    def _resolveOpCodes(self, opCodes):
+        """
+            Converts a preset name, or a collection of opcodes and preset names,
+            into a set of opcodes.
+            An internal function.
+        """
+        if isinstance(opCodes, basestring):
+            opCodes = [opCodes]
+        
+        resolved = set()
+        for opCode in opCodes:
+            if isinstance(opCode, basestring):
+                if opCode not in self._OpCodePresets:
+                    raise Exception("Unrecognised opcode preset \"" + opCode + "\".")
+                resolved.update(self._OpCodePresets[opCode])
             else:
-                print('\t' * self._tabbing + "An error occurred when calling Opcode " + str(iRead) + " (" + self._OpCodes[iRead][2]  + ").")
-            print(str(e))
-            self.e = e
+                resolved.add(opCode)
+        return resolved
+    
+    def _skipRecord(self, opCode, RecordLength = None):
+        """
+            Skips over a record, and any continuation records that follow it,
+            without decoding it.
+            An internal function.
+        """
+        if RecordLength is None:
+            RecordLength = self._readUShort()
+        if RecordLength < 4:
+            raise Exception("Unexpected " + self._OpCodes[opCode][2] + " record length")
+        self._skip(RecordLength - 4)
+        
+        # Vertex lists refer to the vertex palette by byte offset, so keep counting
+        if opCode in [67, 68, 69, 70, 71]:
+            self._VertexCounter += RecordLength
+        
+        opCode = self._readOpCode()
+        while opCode == 23:
+            self._skip(self._readUShort() - 4)
+            opCode = self._readOpCode()
+        if opCode is not None:
+            self._skip(-2)
+    
+    def IndexFile(self, fileName = None):
+        """
+            Walks the opcode and length of every record without decoding any of
+            them and returns a structured array with one row per record holding
+            its OpCode, Offset in the file, total Length (including continuation
+            records) and the tree Depth set by push and pop records.
+        """
+        if fileName is None:
+            if self.fileName is None:
+                raise IOError('No filename specified.')
+            fileName = self.fileName
+        
+        if not os.path.exists(fileName):
+            raise IOError('Could not find file.')
+        
+        # Push and pop records, including subface, extension and attribute levels
+        pushCodes = [10, 19, 21, 122]
+        popCodes = [11, 20, 22, 123]
+        
+        opCodes = array.array('h')
+        offsets = array.array('L')
+        lengths = array.array('L')
+        depths = array.array('h')
+        
+        f = open(fileName, 'rb')
+        try:
+            data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                size = len(data)
+                if size < 4 or _RecordHeader.unpack_from(data, 0)[0] != 1:
+                    raise Exception("Unable to index file. The first record is not a header.")
+                
+                pos = 0
+                depth = 0
+                while pos + 4 <= size:
+                    opCode, RecordLength = _RecordHeader.unpack_from(data, pos)
+                    if RecordLength < 4:
+                        raise Exception("Unexpected record length at offset " + str(pos) + ".")
+                    
+                    if opCode == 23 and len(opCodes) > 0:
+                        # Continuation records extend the previous record
+                        lengths[-1] += RecordLength
+                    else:
+                        if opCode in popCodes:
+                            depth -= 1
+                        opCodes.append(opCode)
+                        offsets.append(pos)
+                        lengths.append(RecordLength)
+                        depths.append(depth)
+                        if opCode in pushCodes:
+                            depth += 1
+                    pos += RecordLength
+            finally:
+                data.close()
         finally:
-            # Close nicely.
-            if self.f is not None:
-                self.f.close()
-                self.f = None
+            f.close()
+        
+        index = np.zeros(len(opCodes), dtype = [('OpCode', np.int16), ('Offset', np.uint64), ('Length', np.uint32), ('Depth', np.int16)])
+        index['OpCode'] = np.frombuffer(opCodes, dtype = np.int16)
+        index['Offset'] = np.frombuffer(offsets, dtype = np.dtype('L'))
+        index['Length'] = np.frombuffer(lengths, dtype = np.dtype('L'))
+        index['Depth'] = np.frombuffer(depths, dtype = np.int16)
+        return index
     
     def _addObject(self, newObject = None):
         """
@@ -556,17 +2205,17 @@ class OpenFlight:
         if newObject is None:
             raise Exception("Unable to add object. No object was defined.")
         
-        # Inject this object into the tree
+        # When streaming, hand the object over instead of growing the tree
+        if self._Events is not None:
+            self._Events.append(('record', newObject))
+            if self._RecordType == "Tree":
+                return
+        
+        # Inject this object into the current node of the tree
         if self._RecordType == "Tree":
-            node = self.Records["Tree"]
-            for idx in self._TreeStack:
-                node = node[idx]
-            node.append(newObject)
+            self._TreeStack[-1].append(newObject)
         elif self._RecordType == "Instances":
-            node = self.Records["Instances"]
-            for idx in self._InstanceStack:
-                node = node[idx]
-            node.append(newObject)
+            self._InstanceStack[-1].append(newObject)
         else:
             raise Exception("Record type not recognised.")
     
@@ -579,145 +2228,109 @@ class OpenFlight:
     
     def _opGroup(self):
         # Opcode 2
-        newObject = dict()
-        
+        newObject = self._readRecord(2)
         newObject['Datatype'] = "Group"
-        newObject['ASCIIID'] = self._readString(8)
-        newObject['RelativePriority'] = self._readShort()
-        
-        # Skip some reserved spot
-        self._skip(2)
-        
-        newObject['Flags'] = self._readUInt()
-        newObject['FXID1'] = self._readShort()
-        newObject['FXID2'] = self._readShort()
-        newObject['Significance'] = self._readShort()
-        newObject['LayerCode'] = self._readUChar()
-        
-        self._skip(5)
-        newObject['LoopCount'] = self._readUInt()
-        newObject['LoopDuration'] = self._readFloat()
-        newObject['LastFrameDuration'] = self._readFloat()
+        newObject['ASCIIID'] = newObject['ASCIIID'].replace('\x00', '')
         
         # Finally inject object into tree
         self._addObject(newObject)
     
     def _opObject(self):
         # Opcode 4
-        newObject = dict()
+        newObject = self._readRecord(4)
         newObject['Datatype'] = "Object"
-        newObject['ASCIIID'] = self._readString(8)
-        newObject['Flags'] = self._readUInt()
-        newObject['RelativePriority'] = self._readShort()
-        newObject['Transparency'] = self._readUShort()
-        newObject['FXID1'] = self._readShort()
-        newObject['FXID2'] = self._readShort()
-        newObject['Significance'] = self._readShort()
-        self._skip(2)
+        newObject['ASCIIID'] = newObject['ASCIIID'].replace('\x00', '')
+        
+        self._addObject(newObject)
+    
+    def _addFaceRow(self, opCode):
+        """
+            Decodes a face or mesh record straight into the face table and
+            adds a tree node holding only its row.
+            An internal function.
+        """
+        values = self._unpack(self._RecordLayouts[opCode][0])
+        
+        # Positions of the draw type, template and light mode in the layout
+        if values[3] not in [0, 1, 2, 3, 4, 8, 9, 10]:
+            raise Exception("Unable to determine draw type.")
+        
+        if values[7] not in [0, 1, 2, 4]:
+            raise Exception("Unable to determine template type.")
+        
+        if values[18] not in [0, 1, 2, 3]:
+            raise Exception("Unable to determine light mode.")
+        
+        row = self.Records['Faces'].append(opCode, values)
         
+        if opCode == 5:
+            # Save the texture pattern for the vertex list command
+            self._TexturePatternIdx = None if values[9] == -1 else values[9]
+        
+        newObject = dict()
+        newObject['Datatype'] = FaceTable._Datatypes[opCode]
+        newObject['Row'] = row
         self._addObject(newObject)
     
     def _opFace(self):
         # Opcode 5
-        newObject = dict()
-        newObject['Datatype'] = "Face"
-        newObject['ASCIIID'] = self._readString(8)
-        newObject['IRColCode'] = self._readUInt()
-        newObject['RelativePriority'] = self._readShort()
+        if self._faceTable:
+            self._addFaceRow(5)
+            return
         
-        newObject['DrawType'] = self._readUChar()
+        newObject = self._readRecord(5)
+        newObject['Datatype'] = "Face"
+        newObject['ASCIIID'] = newObject['ASCIIID'].replace('\x00', '')
         
         drawTypes = [0, 1, 2, 3, 4, 8, 9, 10]
         if newObject['DrawType'] not in drawTypes:
             raise Exception("Unable to determine draw type.")
         
-        newObject['TextureWhite'] = self._readBool()
-        newObject['ColourNameIdx'] = self._readUShort()
-        newObject['AltColourNameIdx'] = self._readUShort()
-        
-        # Skip over reserved
-        self._skip(1)
-        
         templateTypes = [0, 1, 2, 4]
-        newObject['Template'] = self._readUChar()
         if newObject['Template'] not in templateTypes:
             raise Exception("Unable to determine template type.")
         
-        varNames = ['DetailTexturePatternIdx', 'TexturePatternIdx', 'MaterialIdx']
+        lightModes = [0, 1, 2, 3]
+        if newObject['LightMode'] not in lightModes:
+            raise Exception("Unable to determine light mode.")
         
+        varNames = ['DetailTexturePatternIdx', 'TexturePatternIdx', 'MaterialIdx', 'TextureMappingIdx', 'PrimaryColourIdx', 'AltColourIdx', 'ShaderIdx']
         for varName in varNames:
-            newObject[varName] = self._readUShort()
             if newObject[varName] == -1:
                 newObject[varName] = None
         
         # Save this variable for now. It can be collected by the vertex list command
         self._TexturePatternIdx = newObject['TexturePatternIdx']
         
-        newObject['SurfaceMaterialCode'] = self._readShort()
-        newObject['FeatureID'] = self._readShort()
-        
-        newObject['IRMaterialCode'] = self._readUInt()
-        newObject['Transparency'] = self._readShort()
-        newObject['LODGenerationControl'] = self._readUChar()
-        newObject['LineStyleIdx'] = self._readUChar()
-        
-        newObject['Flags'] = self._readUInt()
-        
-        lightModes = [0, 1, 2, 3]
-        newObject['LightMode'] = self._readUChar()
-        if newObject['LightMode'] not in lightModes:
-            raise Exception("Unable to determine light mode.")
-        
-        # Skip over reserved
-        self._skip(7)
-        
-        newObject['PackedColour'] = self._readUInt()
-        newObject['AltPackedColour'] = self._readUInt()
-        
-        newObject['TextureMappingIdx'] = self._readShort()
-        if newObject['TextureMappingIdx'] == -1:
-            newObject['TextureMappingIdx'] = None
-        
-        self._skip(2)
-        
-        newObject['PrimaryColourIdx'] = self._readUInt()
-        if newObject['PrimaryColourIdx'] == -1:
-            newObject['PrimaryColourIdx'] = None
-        
-        newObject['AltColourIdx'] = self._readUInt()
-        if newObject['AltColourIdx'] == -1:
-            newObject['AltColourIdx'] = None
-        
-        self._skip(2)
-        
-        newObject['ShaderIdx'] = self._readShort()
-        if newObject['ShaderIdx'] == -1:
-            newObject['ShaderIdx'] = None
-        
         self._addObject(newObject)
     
     
     def _opPush(self):
         # Opcode 10
+        if self._Events is not None:
+            self._Events.append(('enter', None))
+            if self._RecordType == "Tree":
+                # Only the depth of the tree is tracked when streaming
+                self._TreeStack.append(None)
+                return
+        # The stacks hold the nodes themselves, so the new node is found directly
         if self._RecordType == "Tree":
-            node = self.Records["Tree"]
-            for idx in self._TreeStack:
-                node = node[idx]
-            self._TreeStack.append(len(node))
-            node.append([])
+            node = []
+            self._TreeStack[-1].append(node)
+            self._TreeStack.append(node)
         elif self._RecordType == "Instances":
-            node = self.Records["Instances"]
-            for idx in self._InstanceStack:
-                node = node[idx]
-            self._InstanceStack.append(len(node))
-            node.append([])
+            node = []
+            self._InstanceStack[-1].append(node)
+            self._InstanceStack.append(node)
         else:
             raise Exception("Unable to determine stack type.")
     
     def _opPop(self):
         # Opcode 11
+        if self._Events is not None:
+            self._Events.append(('exit', None))
         if self._RecordType == "Tree":
-            if len(self._TreeStack) == 0:
+            if len(self._TreeStack) == 1:
                 raise Exception("Tree stack is empty: nothing to pop.")
             self._TreeStack.pop()
         elif self._RecordType == "Instances":
@@ -818,7 +2431,7 @@ class OpenFlight:
         newObject['Datatype'] = 'Comment'
         
         # Read the string to the end of the chunk
-        newObject['Text'] = self._readString(len(self._Chunk), fromChunk = True)
+        newObject['Text'] = self._readString(self._chunkRemaining(), fromChunk = True)
         
         # The data chunk should be processed. Reset the variable to None:
         self._Chunk = None
@@ -999,44 +2612,259 @@ class OpenFlight:
         
         # There are no problems. Create an instance and prepare to accept incoming data
         self.Records["Instances"][instance] = []
-        self._InstanceStack.append(instance)
+        self._InstanceStack.append(self.Records["Instances"][instance])
+    
+    def _opExtRef(self):
+        # Opcode 63
+        newObject = dict()
+        newObject['Datatype'] = "ExternalReference"
+        newObject['ASCIIPath'] = self._readString(200)
+        
+        self._skip(4)
+        newObject["Flags"] = self._readUInt()
+        newObject["BoundingBox"] = self._readUShort()
+        self._skip(2)
+        
+        fileName, source = self._resolveExternal(newObject['ASCIIPath'])
+        
+        self._References.append(('external', fileName))
+        if self._deferExternal:
+            # Collect the reference so that it can be read once the file is done
+            if fileName not in self.Records['External'] and fileName not in self._PendingExternal:
+                self._PendingExternal.append(fileName)
+        else:
+            self._readExternalReference(fileName, source)
+        
+        # Inject into tree
+        self._addObject(newObject)
+    
+    def _resolveExternal(self, name):
+        """
+            Returns the key of an external reference in the external records
+            and the file name, data or file object to read it from. The resolver
+            is asked first, if one has been given. Data it returns is kept under
+            the name stored in the file.
+            An internal function.
+        """
+        source = None
+        if self._resolver is not None:
+            source = self._resolver(name, 'external')
+        if source is None:
+            # Clean the pathname and make it usable for this system
+            fileName = self._cleanExternalFilename(name)
+            if not os.path.exists(fileName):
+                # The database may have been archived compressed, under the referenced name
+                for magic, compression, suffix in _CompressionFormats:
+                    if os.path.exists(fileName + suffix):
+                        fileName += suffix
+                        break
+            return fileName, fileName
+        if _isPath(source):
+            return source, source
+        return name, source
+    
+    def _owner(self):
+        """
+            Returns the top-level reader, which holds the external records.
+            An internal function.
+        """
+        if self._parent is None:
+            return self
+        return self._parent
+    
+    def _cacheVariant(self):
+        """
+            Returns the read options that change the decoded records, so that
+            cached external records are only reused with the same options.
+            An internal function.
+        """
+        return (frozenset(self._SkipOpCodes), self._bulkVertices, self._compactRecords, self._faceTable)
+    
+    def _readExternalReference(self, fileName, source = None):
+        """
+            Reads an external database into the external records of the
+            top-level reader, unless it has been read already. It is read from
+            the source, if given, and from the file otherwise. The external
+            cache is used for files when one has been given.
+            An internal function.
+        """
+        owner = self._owner()
+        if fileName in owner.Records['External']:
+            return
+        if source is None:
+            source = fileName
+        externalCache = self._externalCache if _isPath(source) else None
+        cached = None
+        if externalCache is not None:
+            cached = externalCache.get(fileName, self._cacheVariant())
+        if cached is not None:
+            records, references = cached
+            owner.Records['External'][fileName] = records
+            self._readReferences(references)
+            return
+        # This has not been referenced before. 
+        # Create a new instance of this class and read the file.
+        start = timeit.default_timer()
+        extdb = OpenFlight(source, parent = owner, **self._childOptions())
+        extdb.ReadFile(exclude = self._SkipOpCodes)
+        owner.Records['External'][fileName] = extdb.Records
+        if self._Stats is not None:
+            self._addSectionTime('ExternalReferences', timeit.default_timer() - start, _sourceSize(source) or 0)
+        if externalCache is not None and not hasattr(extdb, 'e'):
+            externalCache.put(fileName, self._cacheVariant(), (extdb.Records, extdb._References))
+    
+    def _readTextureReference(self, fileName):
+        """
+            Parses a texture attribute file into the external records of the
+            top-level reader, unless it has been parsed already. With texture
+            workers, the file is parsed in the background and the record is
+            filled in once reading has finished.
+            An internal function.
+        """
+        owner = self._owner()
+        if fileName in owner.Records['External'] or fileName in owner._PendingTextures:
+            return
+        attrFile = None
+        if self._resolver is not None:
+            attrFile = self._resolver(fileName + '.attr', 'texture')
+        # Data from the resolver has no modification time to cache it by, and is parsed straight away
+        if (attrFile is not None and not _isPath(attrFile)) or (self._externalCache is None and self._textureWorkers is None):
+            start = timeit.default_timer()
+            if attrFile is None:
+                owner.Records['External'][fileName] = self._parseTextureFile(fileName)
+            else:
+                owner.Records['External'][fileName] = self._parseAttributeFile(attrFile)
+            if self._Stats is not None:
+                self._addSectionTime('TextureAttributes', timeit.default_timer() - start)
+            return
+        if attrFile is None:
+            attrFile = self._checkTextureFile(fileName)
+        if self._externalCache is not None:
+            cached = self._externalCache.get(attrFile, 'texture')
+            if cached is not None:
+                owner.Records['External'][fileName] = cached
+                return
+        if self._textureWorkers is not None:
+            owner._PendingTextures[fileName] = (attrFile, owner._texturePool().apply_async(self._parseAttributeFile, (attrFile, )))
+            return
+        start = timeit.default_timer()
+        parsed = self._parseAttributeFile(attrFile)
+        if self._Stats is not None:
+            self._addSectionTime('TextureAttributes', timeit.default_timer() - start)
+        self._externalCache.put(attrFile, 'texture', parsed)
+        owner.Records['External'][fileName] = parsed
+    
+    def _texturePool(self):
+        """
+            Returns the thread pool that parses texture attribute files,
+            starting it on first use.
+            An internal function.
+        """
+        if self._TexturePool is None:
+            self._TexturePool = multiprocessing.pool.ThreadPool(self._textureWorkers)
+        return self._TexturePool
+    
+    def _collectTextures(self):
+        """
+            Waits for the texture attribute files parsed in the background and
+            adds them to the external records.
+            An internal function.
+        """
+        try:
+            for fileName, (attrFile, result) in self._PendingTextures.items():
+                parsed = result.get()
+                self.Records['External'][fileName] = parsed
+                if self._externalCache is not None:
+                    self._externalCache.put(attrFile, 'texture', parsed)
+        finally:
+            self._PendingTextures = dict()
+            self._closeTexturePool()
+    
+    def _closeTexturePool(self):
+        """
+            Stops the texture thread pool, if one was started.
+            An internal function.
+        """
+        if self._TexturePool is not None:
+            self._TexturePool.close()
+            self._TexturePool.join()
+            self._TexturePool = None
+    
+    def _readReferences(self, references):
+        """
+            Reads the external references and textures named by a cached file.
+            An internal function.
+        """
+        for kind, fileName in references:
+            if kind == 'external' and self._resolver is not None:
+                self._readExternalReference(*self._resolveExternal(fileName))
+            elif kind == 'external':
+                self._readExternalReference(fileName)
+            else:
+                self._readTextureReference(fileName)
+    
+    def _childOptions(self):
+        """
+            Returns the keyword arguments used to read external references.
+            An internal function.
+        """
+        return dict(verbose = self._verbose, tabbing = self._tabbing + 1, memoryMap = self._memoryMap, bulkVertices = self._bulkVertices,
+                    compactRecords = self._compactRecords, faceTable = self._faceTable, externalCache = self._externalCache,
+                    textureWorkers = self._textureWorkers, resolver = self._resolver)
     
-    def _opExtRef(self):
-        # Opcode 63
-        newObject = dict()
-        newObject['Datatype'] = "ExternalReference"
-        newObject['ASCIIPath'] = self._readString(200)
-        
-        self._skip(4)
-        newObject["Flags"] = self._readUInt()
-        newObject["BoundingBox"] = self._readUShort()
-        self._skip(2)
-        
-        # Clean the pathname and make it usable for this system
-        fileName = self._cleanExternalFilename(newObject['ASCIIPath'])
-        
-        # Check to see if this is the parent class:
-        if self._parent is None:
-            # Yes, this is the parent class
-            if fileName not in self.Records['External']:
-                # This has not been referenced before. 
-                # Create a new instance of this class and read the file.
-                extdb = OpenFlight(fileName, verbose = self._verbose, parent = self, tabbing = self._tabbing + 1)
-                extdb.ReadFile()
-                self.Records['External'][fileName] = extdb.Records
-                extdb = None
-        else:
-            # This is a child class. Add this object to the parent class
-            if fileName not in self._parent.Records['External']:
-                # This has not been referenced before:
-                # Create a new instance of this class and read the file.
-                extdb = OpenFlight(fileName, verbose = self._verbose, parent = self._parent, tabbing = self._tabbing + 1)
-                extdb.ReadFile()
-                self._parent.Records['External'][filename] = extdb.Records
-                extdb = None
+    def _readExternals(self):
+        """
+            Reads the collected external references with a pool of worker
+            processes. References found in those files are read in turn until
+            none remain, and everything is merged into Records['External'] as
+            the sequential reader would have done.
+            An internal function.
+        """
+        # Each worker process reads without the cache, which is merged here instead
+        options = self._childOptions()
+        options['externalCache'] = None
+        variant = self._cacheVariant()
+        
+        requested = set(self._PendingExternal)
+        pending = self._PendingExternal
+        pool = multiprocessing.Pool(self._externalWorkers)
+        
+        def addReferences(references):
+            for kind, reference in references:
+                if kind != 'external':
+                    self._readTextureReference(reference)
+                elif reference not in requested and reference not in self.Records['External']:
+                    requested.add(reference)
+                    pending.append(reference)
         
-        # Inject into tree
-        self._addObject(newObject)
+        try:
+            while pending:
+                # Cached files are attached in place, the rest are read by the pool
+                order = []
+                for fileName in pending:
+                    cached = None
+                    if self._externalCache is not None:
+                        cached = self._externalCache.get(fileName, variant)
+                    order.append((fileName, cached))
+                tasks = [(name, options, self._SkipOpCodes) for name, entry in order if entry is None]
+                results = pool.imap(_readExternal, tasks)
+                pending = []
+                for fileName, cached in order:
+                    if cached is not None:
+                        records, references = cached
+                    else:
+                        fileName, records, external, references, failed = next(results)
+                        for key in external:
+                            if key not in self.Records['External']:
+                                self.Records['External'][key] = external[key]
+                        if self._externalCache is not None and not failed:
+                            self._externalCache.put(fileName, variant, (records, references))
+                    self.Records['External'][fileName] = records
+                    addReferences(references)
+        finally:
+            pool.close()
+            pool.join()
+        self._PendingExternal = []
     
     def _opTexturePalette(self):
         # Opcode 64
@@ -1048,17 +2876,8 @@ class OpenFlight:
         for colIdx in range(2):
             newObject['LocationInTexturePalette'][0, colIdx] = self._readUInt()
         
-        # Check to see if this is the parent class
-        if self._parent is None:
-            # This is the parent class. Use the local records
-            if newObject['Filename'] not in self.Records['External']:
-                # This has not been referenced before.
-                self.Records['External'][newObject['Filename']] = self._parseTextureFile(newObject['Filename'])
-        else:
-            # This is a child class. Add this object to the parent class
-            if newObject['Filename'] not in self._parent.Records['External']:
-                # This has not been referenced before:
-                self._parent.Records['External'][newObject['Filename']] = self._parseTextureFile(newObject['Filename'])
+        self._References.append(('texture', newObject['Filename']))
+        self._readTextureReference(newObject['Filename'])
         
         self._addObject(newObject)
         # Next append to the textures list.
@@ -1073,6 +2892,82 @@ class OpenFlight:
         
         self._addObject(newObject)
         self._VertexCounter += 8
+        
+        if self._bulkVertices:
+            # The length covers this record and every vertex record that follows it
+            self._readVertexBlocks(newObject['Length'] - 8)
+    
+    
+    def _readVertexBlocks(self, size):
+        """
+            Decodes the vertex records of the vertex palette in runs of the same
+            type, each with a single np.frombuffer call. Every run is added to the
+            vertex store, and to the tree as a vertex block naming its rows,
+            unless its vertex type is excluded.
+            An internal function.
+        """
+        if self._Buffer is not None:
+            data = self._Buffer
+            start = self._Offset
+        else:
+            data = self.f.read(size)
+            start = 0
+        end = start + size
+        
+        pos = start
+        while pos < end:
+            opCode = _Short.unpack_from(data, pos)[0]
+            if opCode not in self._VertexDtypes:
+                raise Exception("Unexpected opcode " + str(opCode) + " in vertex palette.")
+            dtype, datatype = self._VertexDtypes[opCode]
+            
+            count = self._vertexRunLength(data, pos, end, opCode, dtype)
+            if count == 0:
+                raise Exception("Unexpected " + self._OpCodes[opCode][2] + " record length")
+            
+            if opCode in self._SkipOpCodes:
+                # Excluded vertex types are left out, as they are when read one at a time
+                pos += count * dtype.itemsize
+                self._VertexCounter += count * dtype.itemsize
+                continue
+            
+            records = np.frombuffer(data, dtype = dtype, count = count, offset = pos)
+            
+            newObject = dict()
+            newObject['Datatype'] = 'VertexBlock'
+            newObject['VertexDatatype'] = datatype
+            newObject['NumberOfVertices'] = count
+            # The vertices themselves are held in the columns of the vertex store
+            byteOffset = self._VertexCounter + np.arange(count, dtype = np.uint32) * dtype.itemsize
+            newObject['FirstRow'] = self.Records['Vertices'].appendBlock(byteOffset, opCode, records)
+            
+            self._addObject(newObject)
+            
+            pos += count * dtype.itemsize
+            self._VertexCounter += count * dtype.itemsize
+        
+        if self._Buffer is not None:
+            self._Offset = end
+    
+    
+    def _vertexRunLength(self, data, pos, end, opCode, dtype):
+        """
+            Returns the number of consecutive vertex records of the given type,
+            checking their headers in growing windows.
+            An internal function.
+        """
+        available = (end - pos) // dtype.itemsize
+        count = 0
+        window = 256
+        while count < available:
+            window = min(window, available - count)
+            heads = np.frombuffer(data, dtype = dtype, count = window, offset = pos + count * dtype.itemsize)
+            breaks = np.flatnonzero((heads['OpCode'] != opCode) | (heads['Length'] != dtype.itemsize))
+            if len(breaks) > 0:
+                return count + breaks[0]
+            count += window
+            window *= 2
+        return count
     
     
     def _opVertexColour(self):
@@ -1090,8 +2985,7 @@ class OpenFlight:
         newObject['VertexColourIndex'] = self._readUInt()
         
         self._addObject(newObject)
-        self.Records['Vertices'][self._VertexCounter] = newObject
-        self.Records['VertexUV'].append(None)
+        self.Records['Vertices'].appendVertex(self._VertexCounter, 68, newObject)
         self._VertexCounter += 40
     
     
@@ -1116,8 +3010,7 @@ class OpenFlight:
         self._skip(4)
         
         self._addObject(newObject)
-        self.Records['Vertices'][self._VertexCounter] = newObject
-        self.Records['VertexUV'].append(None)
+        self.Records['Vertices'].appendVertex(self._VertexCounter, 69, newObject)
         self._VertexCounter += 56
     
     
@@ -1146,8 +3039,7 @@ class OpenFlight:
         self._skip(4)
         
         self._addObject(newObject)
-        self.Records['Vertices'][self._VertexCounter] = newObject
-        self.Records['VertexUV'].append(newObject['TextureCoordinate'])
+        self.Records['Vertices'].appendVertex(self._VertexCounter, 70, newObject)
         self._VertexCounter += 64
     
     
@@ -1170,8 +3062,7 @@ class OpenFlight:
         newObject['VertexColourIndex'] = self._readUInt()
         
         self._addObject(newObject)
-        self.Records['Vertices'][self._VertexCounter] = newObject
-        self.Records['VertexUV'].append(newObject['TextureCoordinate'])
+        self.Records['Vertices'].appendVertex(self._VertexCounter, 71, newObject)
         self._VertexCounter += 48
     
     
@@ -1185,44 +3076,24 @@ class OpenFlight:
         newObject['Datatype'] = "VertexList"
         RecordLength = len(self._Chunk)
         
-        newObject['ByteOffset'] = []
-        
-        for verIdx in range((RecordLength / 4)):
-            newObject['ByteOffset'].append(self._readUInt(fromChunk = True))
+        newObject['ByteOffset'] = self._readArray('>u4', RecordLength / 4, fromChunk = True)
         
         # The data chunk should be processed. Reset the variable to None:
         self._Chunk = None
         
         self._addObject(newObject)
         
-        # And keep a copy in the vertex list
-        self.Records["VertexList"].append(newObject['ByteOffset'])
-        self.Records["TexturePatterns"].append(self._TexturePatternIdx)
+        # And keep a copy in the vertex list, unless streaming
+        if self._Events is None:
+            self.Records["VertexList"].append(newObject['ByteOffset'])
+            self.Records["TexturePatterns"].append(self._TexturePatternIdx)
     
     
     def _opLoD(self):
         # Opcode 73
-        newObject = dict()
+        newObject = self._readRecord(73)
         newObject['Datatype'] = 'LevelOfDetail'
-        newObject['ASCIIID'] = self._readString(8)
-        
-        # Skip over the reserved area
-        self.read.seek(4, os.SEEK_CUR)
-        
-        newObject['SwitchInDistance'] = self._readDouble()
-        newObject['SwitchOutDistance'] = self._readDouble()
-        
-        newObject['FXID1'] = self._readShort()
-        newObject['FXID2'] = self._readShort()
-        
-        newObject['Flags'] = self._readUInt()
-        
-        varNames = ['x', 'y', 'z']
-        
-        for varName in varNames:
-            newObject[varName + 'Centre'] = self._readDouble()
-        newObject['TransitionRange'] = self._readDouble()
-        newObject['SignificantSize'] = self._readDouble()
+        newObject['ASCIIID'] = newObject['ASCIIID'].replace('\x00', '')
         
         self._addObject(newObject)
     
@@ -1464,83 +3335,31 @@ class OpenFlight:
     
     def _opMesh(self):
         # Opcode 84
-        newObject = dict()
-        newObject['Datatype'] = 'Mesh'
-        
         # This is identical to the face record.
+        if self._faceTable:
+            self._addFaceRow(84)
+            return
         
-        newObject['ASCIIID'] = self._readString(8)
-        
-        self._skip(4)
-        
-        newObject['IRColourCode'] = self._readUInt()
-        newObject['RelativePriority'] = self._readShort()
-        
-        newObject['DrawType'] = self._readUChar()
+        newObject = self._readRecord(84)
+        newObject['Datatype'] = 'Mesh'
+        newObject['ASCIIID'] = newObject['ASCIIID'].replace('\x00', '')
         
         drawTypes = [0, 1, 2, 3, 4, 8, 9, 10]
         if newObject['DrawType'] not in drawTypes:
             raise Exception("Unable to determine draw type.")
         
-        newObject['TextureWhite'] = self._readBool()
-        newObject['ColourNameIdx'] = self._readUShort()
-        newObject['AltColourNameIdx'] = self._readUShort()
-        
-        # Skip over reserved
-        self._skip(1)
-        
         templateTypes = [0, 1, 2, 4]
-        newObject['Template'] = self._readUChar()
         if newObject['Template'] not in templateTypes:
             raise Exception("Unable to determine template type.")
         
-        varNames = ['DetailTexturePatternIdx', 'TexturePatternIdx', 'MaterialIdx']
-        
-        for varName in varNames:
-            newObject[varName] = self._readShort()
-            if newObject[varName] == -1:
-                newObject[varName] = None
-        
-        newObject['SurfaceMaterialCode'] = self._readShort()
-        newObject['FeatureID'] = self._readShort()
-        
-        newObject['IRMaterialCode'] = self._readUInt()
-        newObject['Transparency'] = self._readUShort()
-        newObject['LODGenerationControl'] = self._readUChar()
-        newObject['LineStyleIdx'] = self._readUChar()
-        
-        newObject['Flags'] = self._readUInt()
-        
         lightModes = [0, 1, 2, 3]
-        newObject['LightMode'] = self._readUChar()
         if newObject['LightMode'] not in lightModes:
             raise Exception("Unable to determine light mode.")
         
-        # Skip over reserved
-        self._skip(7)
-        
-        newObject['PackedColour'] = self._readUInt()
-        newObject['AltPackedColour'] = self._readUInt()
-        
-        newObject['TextureMappingIdx'] = self._readShort()
-        if newObject['TextureMappingIdx'] == -1:
-            newObject['TextureMappingIdx'] = None
-        
-        self._skip(2)
-        
-        newObject['PrimaryColourIdx'] = self._readUInt()
-        if newObject['PrimaryColourIdx'] == -1:
-            newObject['PrimaryColourIdx'] = None
-        
-        newObject['AltColourIdx'] = self._readUInt()
-        if newObject['AltColourIdx'] == -1:
-            newObject['AltColourIdx'] = None
-        
-        self._skip(2)
-        
-        newObject['ShaderIdx'] = self._readShort()
-        if newObject['ShaderIdx'] == -1:
-            newObject['ShaderIdx'] = None
+        varNames = ['DetailTexturePatternIdx', 'TexturePatternIdx', 'MaterialIdx', 'TextureMappingIdx', 'PrimaryColourIdx', 'AltColourIdx', 'ShaderIdx']
+        for varName in varNames:
+            if newObject[varName] == -1:
+                newObject[varName] = None
         
         self._addObject(newObject)
     
@@ -1556,13 +3375,38 @@ class OpenFlight:
         newObject['NumberOfVertices'] = self._readUInt(fromChunk = True)
         newObject['AttributeMask'] = self._readUInt(fromChunk = True)
         
+        dtype = self._localVertexDtype(newObject['AttributeMask'])
+        
+        # Read the whole pool at once and store each attribute as a column
+        if dtype.itemsize > 0:
+            vertices = np.frombuffer(self._Chunk, dtype = dtype, count = newObject['NumberOfVertices'], offset = self._ChunkOffset)
+            self._ChunkOffset += newObject['NumberOfVertices'] * dtype.itemsize
+            for varName in dtype.names:
+                # Convert to native byte order. This also copies the data out of the chunk.
+                newObject[varName] = vertices[varName].astype(vertices[varName].dtype.newbyteorder('='))
+        
+        # The data chunk should be processed. Reset the variable to None:
+        self._Chunk = None
+        
+        self._addObject(newObject)
+    
+    
+    def _localVertexDtype(self, attributeMask):
+        """
+            Returns the structured dtype of a local vertex pool entry for the
+            given attribute mask. Each mask is only converted once.
+            An internal function.
+        """
+        if attributeMask in self._LocalVertexDtypes:
+            return self._LocalVertexDtypes[attributeMask]
+        
         mask = 0x01
         
         Flags = [False] * 12
         
         # Now process the attribute mask:
         for idx in range(12):
-            if newObject['AttributeMask'] & mask > 0:
+            if attributeMask & mask > 0:
                 Flags[idx] = True
             # Shift the mask left by one
             mask <<= 1
@@ -1570,42 +3414,25 @@ class OpenFlight:
         if Flags[1] and Flags[2]:
             raise Exception("Unable to determine colour for vertex. Both colour index and RGBA colour are set.")
         
+        fields = []
+        if Flags[0]:
+            fields.append(('Coordinate', '>f8', 3))
+        if Flags[1] or Flags[2]:
+            # Whilst the flags mean different things, they have similar construction
+            fields.append(('Colour', '>u1', 4))
+        if Flags[3]:
+            fields.append(('Normal', '>f4', 3))
+        
         varNames = ['UVBase']
         varNames.extend(['UV' + str(idx) for idx in range(1, 8)])
         
         # Now only take those variable names that have been enabled
-        varNames = [filt[0] for filt in zip(varNames, Flags[4:]) if filt[1]]
-        
-        newObject['LocalVertexPool'] = []
-        for idx in range(newObject['NumberOfVertices']):
-            tempDict = dict()
-            
-            if Flags[0]:
-                tempDict['Coordinate'] = np.zeros((1, 3))
-                for colIdx in range(3):
-                    tempDict['Coordinate'][0, colIdx] = self._readDouble(fromChunk = True)
-            if Flags[1] or Flags[2]:
-                # Whilst the flags mean different things, they have similar construction
-                tempDict['Colour'] = np.zeros((1, 4))
-                for colIdx in range(4):
-                    tempDict['Colour'][0, colIdx] = self._readUChar(fromChunk = True)
-            if Flags[3]:
-                tempDict['Normal'] = np.zeros((1, 3))
-                for colIdx in range(3):
-                    tempDict['Normal'][0, colIdx] = self._readFloat(fromChunk = True)
-            for varName in varNames:
-                tempDict[varName] = np.zeros((1, 2))
-                for colIdx in range(2):
-                    tempDict[varName][0, colIdx] = self._readFloat(fromChunk = True)
-            
-            newObject['LocalVertexPool'].append(tempDict)
-        
-        tempDict = None
+        for varName, flag in zip(varNames, Flags[4:]):
+            if flag:
+                fields.append((varName, '>f4', 2))
         
-        # The data chunk should be processed. Reset the variable to None:
-        self._Chunk = None
-        
-        self._addObject(newObject)
+        self._LocalVertexDtypes[attributeMask] = np.dtype(fields)
+        return self._LocalVertexDtypes[attributeMask]
     
     
     def _opMeshPrim(self):
@@ -1623,16 +3450,11 @@ class OpenFlight:
         if indexSize not in [1, 2, 4]:
             raise Exception("Unable to determine the index size.")
         
-        functions = {1: self._readSChar, 2: self._readShort, 4: self._readInt}
-        
-        readFunction = functions[indexSize]
+        dtypes = {1: '>i1', 2: '>i2', 4: '>i4'}
         
         newObject['VertexCount'] = self._readUInt(fromChunk = True)
         
-        newObject['VertexIndex'] = []
-        
-        for idx in range(newObject['VertexCount']):
-            newObject['VertexIndex'].append(readFunction(fromChunk = True))
+        newObject['VertexIndex'] = self._readArray(dtypes[indexSize], newObject['VertexCount'], fromChunk = True)
         
         # The data chunk should be processed. Reset the variable to None:
         self._Chunk = None
@@ -1727,7 +3549,7 @@ class OpenFlight:
         if subtype == 2:
             newObject['Subtype'] = 'KeyDataRecord'
             newObject['DataLength'] = self._readInt()
-            newobject['PackedData'] = self.f.read(RecordLength - 12)
+            newObject['PackedData'] = self._readBytes(RecordLength - 12)
         
         # Finally, add this object to the stack:
         self._addObject(newObject)
@@ -1942,7 +3764,7 @@ class OpenFlight:
         for varName in varNames:
             newObject[varName] = []
             for colIdx in range(5):
-                newObject[varName].append(struct.unpack('>d', self.f.read(8))[0])
+                newObject[varName].append(self._readDouble())
         
         self._addObject(newObject)
     
@@ -1964,7 +3786,7 @@ class OpenFlight:
         newObject['Revision'] = self._readSChar(fromChunk = True)
         newObject['RecordCode'] = self._readUShort(fromChunk = True)
         
-        newObject['ExtendedData'] = self._readString(len(self._Chunk), fromChunk = True)
+        newObject['ExtendedData'] = self._readString(self._chunkRemaining(), fromChunk = True)
         
         # The data chunk should be processed. Reset the variable to None:
         self._Chunk = None
@@ -2083,7 +3905,7 @@ class OpenFlight:
         newObject['Vertex2'] = []
         newObject['Vertex3'] = []
         
-        RecordLength = len(self._Chunk)
+        RecordLength = self._chunkRemaining()
         
         # Read the vertex records:
         for triangleIdx in range(RecordLength / 8):
@@ -2136,57 +3958,26 @@ class OpenFlight:
     
     def _opLightPt(self):
         # Opcode 111
-        newObject = dict()
+        newObject = self._readRecord(111)
         newObject['Datatype'] = 'LightPoint'
-        newObject['ASCIIID'] = self._readString(8)
-        
-        varNames = ['SurfaceMaterialCode', 'FeatureID']
-        for varName in varNames:
-            newObject[varName] = self._readUShort()
-        
-        varNames = ['BackColourBiDir', 'DisplayMode']
-        for varName in varNames:
-            newObject[varName] = self._readUInt()
+        newObject['ASCIIID'] = newObject['ASCIIID'].replace('\x00', '')
         
         # DisplayMode can only take a few values
         if newObject['DisplayMode'] not in [0, 1, 2]:
             raise Exception("Unable to determine display mode.")
         
-        varNames = ['Intensity', 'BackIntensity', 'MinimumDefocus', 'MaximumDefocus']
-        for varName in varNames:
-            newObject[varName] = self._readFloat()
-        
         varNames = [('FadingMode', 'fading mode'), ('FogPunchMode', 'fog punch mode'), ('DirectionalMode', 'directional mode'), ('RangeMode', 'range mode')]
         
         for varName in varNames:
-            newObject[varName[0]] = self._readUInt()
             if newObject[varName[0]] not in [0, 1]:
                 raise Exception("Unable to determine " + varName[1] + ".")
         
-        varNames = ['MinPixelSize', 'MaxPixelSize', 'ActualSize', 'TransparentFalloffPixelSize', 'TransparentFalloffExponent', 'TransparentFalloffScalar', 'TransparentFalloffClamp', 'FogScalar', None, 'SizeDifferenceThreshold']
-        
-        for varName in varNames:
-            # Skip over reserved space
-            if varName is None:
-                self._skip(4)
-            else:
-                newObject[varName] = self._readFloat()
-        
-        newObject['Directionality'] = self._readUInt()
         if newObject['Directionality'] not in [0, 1, 2]:
             raise Exception("Unable to determine directionality.")
         
-        varNames = ['HorizontalLobeAngle', 'VerticalLobeAngle', 'LobeRollAngle', 'DirectionalFalloffExponent', 'DirectionalAmbientIntensity', 'AnimationPeriod', 'AnimationPhaseDelay', 'AnimationEnabledPeriod', 'Significance']
-        for varName in varNames:
-            newObject[varName] = self._readFloat()
-        
-        newObject['CalligraphicDrawOrder'] = self._readInt()
-        
-        newObject['Flags'] = self._readUInt()
-        
         newObject['AxisOfRotation'] = np.zeros((1, 3))
-        for colIdx in range(3):
-            newObject['AxisOfRotation'][0, colIdx] = self._readFloat()
+        for colIdx, component in enumerate(['i', 'j', 'k']):
+            newObject['AxisOfRotation'][0, colIdx] = newObject.pop('AxisOfRotation' + component)
         
         self._addObject(newObject)
     
@@ -2345,7 +4136,7 @@ class OpenFlight:
                 for colIdx in range(3):
                     newObject[varName][0, colIdx] = self._readDouble()
         else:
-            print("Unable to handle to type of texture mapping type. Skipping this section.")
+            _log.warning("Unable to handle to type of texture mapping type. Skipping this section.")
         
         # Now check to see if the warped mapping was enabled
         if newObject['WarpedFlag'] == 1:
@@ -2596,7 +4387,7 @@ class OpenFlight:
         newObject['FeatureID'] = self._readUShort()
         newObject['BackColourBiDir'] = self._readUInt()
         
-        newObject['DisplayMode'] = struct.unpack('>H', self.f.read(4))[0]
+        newObject['DisplayMode'] = self._readUInt()
         if newObject['DisplayMode'] not in [0, 1, 2]:
             raise Exception("Unable to determine display mode.")
         
@@ -2747,7 +4538,7 @@ class OpenFlight:
             for varName in varNames:
                 newObject[varName] = self._readString(256)
         elif newObject['ShaderType'] == 1:
-            print("CgFX shader type has not been implemented. Skipping...")
+            _log.warning("CgFX shader type has not been implemented. Skipping...")
             self._skip(RecordLength - 1036)
         else:
             # Only OpenGL shading language left (i.e. type 2)
@@ -3048,26 +4839,41 @@ class OpenFlight:
         # block and this should be followed by the continous blocks.
         RecordLength = self._readUShort()
         
-        # Then read everything except the header.
-        chunk = self.f.read(RecordLength - 4)
+        # Then read everything except the header. When memory mapped, the chunk
+        # is a view onto the map rather than a copy.
+        if self._Buffer is not None:
+            chunk = buffer(self._Buffer, self._Offset, RecordLength - 4)
+            self._Offset += RecordLength - 4
+        else:
+            chunk = self.f.read(RecordLength - 4)
         
         # Now determine if the next block is a continuous opcode
-        opCode = self._readUShort()
+        opCode = self._readOpCode()
+        
+        if opCode == 23:
+            if self._Stats is not None:
+                start = timeit.default_timer()
+            # Collect the continuation records and join them once so that
+            # large records are assembled in linear time
+            chunks = [str(chunk)]
+            while opCode == 23:
+                # See how much data needs to be extracted
+                RecordLength = self._readUShort()
+                chunks.append(self._readBytes(RecordLength - 4))
+                
+                # Now read the next opCode
+                opCode = self._readOpCode()
+            chunk = ''.join(chunks)
+            if self._Stats is not None:
+                self._addSectionTime('ContinuationAssembly', timeit.default_timer() - start, len(chunk))
         
-        while opCode == 23:
-            # See how much data needs to be extracted
-            RecordLength = self._readUShort()
-            
-            # Append this record to the previous
-            chunk += self.f.read(RecordLength - 4)
-            
-            # Now read the next opCode
-            opCode = self._readUShort()
         # Previous instruction was to read the next opCode. If here, opCode was not a
         # continuous record, so back two bytes.
-        self._skip(-2)
-        # Save the chunk to a global variable
+        if opCode is not None:
+            self._skip(-2)
+        # Save the chunk to a global variable and decode it from the start
         self._Chunk = chunk
+        self._ChunkOffset = 0
     
     
     def _cleanExternalFilename(self, fileName = None, isTexture = True):
@@ -3079,13 +4885,13 @@ class OpenFlight:
         
         if fileName[0] == '.':
             # This is based on a relative path. Extract the contents of the stored filename:
-            if self.fileName is None:
+            if _sourceName(self.fileName) is None:
                 if isTexture:
                     raise IOError('Attribute file uses relative path names. Unable to determine relative path.')
                 else:
                     raise IOError('External reference filename uses relative path names. Unable to determine relative path.')
             # If here, we can extract the path:
-            fileName = os.path.dirname(self.fileName) + os.sep + fileName
+            fileName = os.path.dirname(_sourceName(self.fileName)) + os.sep + fileName
         
         # Check to see if this can be accessed firstly.
         if not os.path.exists(fileName):
@@ -3107,7 +4913,7 @@ class OpenFlight:
                 if os.path.exists(fileName.replace('\\', os.sep)):
                     fileName = fileName.replace('\\', os.sep)
                 else:
-                    print '\t' * self._tabbing + 'Problems with filename: ' + fileName
+                    _log.warning("Problems with filename: %s", fileName)
                     # If here, the issue couldn't be resolved. Throw an error.
                     if isTexture:
                         raise IOError('Unable to translate texture filename.')
@@ -3142,186 +4948,419 @@ class OpenFlight:
             raise IOError('No texture filename specified.')
         
         # Now return a filename that we know should work
-        fileName = self._checkTextureFile(fileName)
-        
-        f = open(fileName, 'rb')
-        
-        # For parsing the texture file, we cannot use the shortcut commands created. Instead, define them within this function
-        def readInt():
-            return struct.unpack('>i', f.read(4))[0]
-        
-        def readFloat():
-            return struct.unpack('>f', f.read(4))[0]
-        
-        def readDouble():
-            return struct.unpack('>d', f.read(8))[0]
-        
-        def readString(noBytes):
-            return struct.unpack('>' + str(noBytes) + 's', f.read(noBytes))[0].replace('\x00', '')
+        return self._parseAttributeFile(self._checkTextureFile(fileName))
+    
+    def _parseAttributeFile(self, attrFile):
+        """
+            Parses a texture attribute file, given as a file name, data or a
+            file object. Files are read in one go and the fixed part is decoded
+            with a single unpack. Parsed files are kept between reads by the
+            external cache of the reader, if it has one.
+        """
+        if not _isPath(attrFile):
+            data = _sourceData(attrFile)
+        else:
+            f = open(attrFile, 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
         
-        def skip(noBytes):
-            f.seek(noBytes, os.SEEK_CUR)
+        newObject = dict()
+        newObject['Datatype'] = 'TextureAttribute'
         
         try:
-            f.seek(0)
-            newObject = dict()
-            newObject['Datatype'] = 'TextureAttribute'
-            
-            varNames = ['NumberOfTexelsU', 'NumberOfTexelsV', None, None, 'xUp', 'yUp', 'FileFormatType', 'MinificationFilterType', 'MagnificationFilterType', 'WrapMethod', 'WrapMethodUV', 'WrapMethodU', 'WrapMethodV', 'ModifiedFlag', 'xPivot', 'yPivot', 'EnvironmentType', 'IntensityPattern']
-            for varName in varNames:
-                if varName is None:
-                    skip(4)
-                else:
-                    newObject[varName] = readInt()
-            
-            # Now process these readings:
-            if newObject['FileFormatType'] not in range(6):
-                raise Exception('Unable to determine file format type.')
-            
-            typeNames = ['AT&T image 8 pattern', 'AT&T image 8 template', 'SGI intensity modulation', 'SGI intensity with alpha', 'SGI RGB', 'SGI RGB with alpha']
-            newObject['FileFormatName'] = typeNames[newObject['FileFormatType']]
-            
-            if newObject['MinificationFilterType'] not in range(13):
-                raise Exception('Unable to determine minification filter type.')
-            
-            if newObject['MagnificationFilterType'] not in range(11):
-                raise Exception('Unable to determine magnification filter type.')
-            
-            if newObject['WrapMethodUV'] not in [0, 1, 4]:
-                raise Exception('Unable to determine wrap method u,v.')
-            if newObject['WrapMethodU'] not in [0, 1, 3, 4]:
-                raise Exception('Unable to determine wrap method u.')
-            if newObject['WrapMethodV'] not in [0, 1, 3, 4]:
-                raise Exception('Unable to determine wrap method v.')
-            
-            if newObject['EnvironmentType'] not in range(5):
-                raise Exception('Unable to determine environment type.')
-            
-            # Finished processing. Now skip over a reserved area:
-            # This skip is based on version OpenFlight versions prior to 16.1. After this,
-            # an additional 4 bytes was added to instructions.
-            skip(32)
-            # skip(36)
-            
-            newObject['RealWorldSizeDirectionU'] = readDouble()
-            newObject['RealWorldSizeDirectionV'] = readDouble()
-            
-            varNames = ['CodeForOriginOfImportedTexture', 'KernelVersionNumber', 'InternalFormatType', 'ExternalFormatType', 'MIPMAP']
-            
-            for varName in varNames:
-                newObject[varName] = readInt()
-            
-            # Now process these readings:
-            if newObject['InternalFormatType'] not in range(10):
-                raise Exception('Unable to determine internal format type.')
-            if newObject['ExternalFormatType'] not in range(3):
-                raise Exception('Unable to determine external format type.')
-            
-            newObject['SeparableSymmetricFilterKernel'] = np.zeros((1, 8))
-            for colIdx in range(8):
-                newObject['SeparableSymmetricFilterKernel'][0, colIdx] = readFloat()
-            
-            newObject['SendTXControlPoints'] = readInt()
-            
-            for idx in range(8):
-                newObject['LOD' + str(idx)] = readFloat()
-                newObject['Scale' + str(idx)] = readFloat()
-            
-            newObject['ControlClamp'] = readFloat()
-            
-            newObject['AlphaMagnificationFilterType'] = readInt()
-            if newObject['AlphaMagnificationFilterType'] not in range(11):
-                raise Exception('Unable to determine magnification filter type for alpha.')
-            newObject['ColourMagnificationFilterType'] = readInt()
-            if newObject['ColourMagnificationFilterType'] not in range(11):
-                raise Exception('Unable to determine magnification filter type for colour.')
-            
-            # Skip over reserved area:
-            skip(36)
-            
-            varNames = ['CentralMeridian', 'UpperLatitude', 'LowerLatitude']
-            
-            for varName in varNames:
-                newObject['LambertConicProjection' + varName] = readDouble()
-            
-            # Skip over reserved region:
-            skip(28)
-            
-            varNames = ['Using', 'J', 'K', 'M', 'N', 'Scramble']
-            for varName in varNames:
-                newObject[varName + 'TXDetail'] = readInt()
-            
-            newObject['UsingTXTile'] = readInt()
-            
-            varNames = ['LowerLeftU', 'LowerLeftV', 'UpperRightU', 'UpperRightV']
-            for varName in varNames:
-                newObject[varName + 'TXTile'] = readFloat()
-            
-            varNames = ['Projection', 'EarthModel', None, 'UTMZone', 'ImageOrigin', 'GeospecificPointsUnits']
-            for varName in varNames:
-                if varName is None:
-                    skip(4)
-                else:
-                    newObject[varName] = readInt()
-            
-            # Now validate the input:
-            if newObject['Projection'] not in [0, 3, 4, 7]:
-                raise Exception('Unable to determine projection.')
-            
-            if newObject['EarthModel'] not in range(5):
-                raise Exception('Unable to determine earth model.')
-            
-            if newObject['ImageOrigin'] not in [0, 1]:
-                raise Exception('Unable to determine image origin.')
-            
-            if newObject['GeospecificPointsUnits'] not in range(3):
-                raise Exception('Unable to determine geospecific points units.')
-            
-            skip(8)
-            newObject['HemisphereForGeospecificPointsUnits'] = readInt()
-            if newObject['HemisphereForGeospecificPointsUnits'] not in [0, 1]:
-                raise Exception('Unable to determine hemisphere for geospecific points units.')
+            if len(data) >= _TextureAttributeLayout.size:
+                fields = _TextureAttributeFields
+                values = _TextureAttributeLayout.unpack_from(data)
+            else:
+                # The file ended early. Decode the fields that are there, then warn below.
+                fields = []
+                size = 0
+                for varName, fmt in _TextureAttributeFields:
+                    size += struct.calcsize('>' + fmt)
+                    if size > len(data):
+                        break
+                    fields.append((varName, fmt))
+                values = struct.unpack_from('>' + ''.join(fmt for varName, fmt in fields), data)
             
-            skip(12)
-            newObject['TextureForCubemap'] = readInt()
+            values = iter(values)
+            for varName, fmt in fields:
+                if varName == 'SeparableSymmetricFilterKernel':
+                    newObject[varName] = np.array([[next(values) for colIdx in range(8)]])
+                elif varName is not None:
+                    newObject[varName] = next(values)
+            if 'Comments' in newObject:
+                newObject['Comments'] = newObject['Comments'].replace('\x00', '')
             
-            skip(588)
-            newObject['Comments'] = readString(512)
+            # Now validate the readings:
+            for varName, accepted, message in _TextureAttributeChecks:
+                if varName in newObject and newObject[varName] not in accepted:
+                    raise Exception(message)
             
-            # This skip is based on version OpenFlight versions prior to 16.1. After this,
-            # an additional 4 bytes was added to instructions.
-            skip(52)
-            # skip(56)
+            if 'FileFormatType' in newObject:
+                typeNames = ['AT&T image 8 pattern', 'AT&T image 8 template', 'SGI intensity modulation', 'SGI intensity with alpha', 'SGI RGB', 'SGI RGB with alpha']
+                newObject['FileFormatName'] = typeNames[newObject['FileFormatType']]
             
-            newObject['AttributeFileVersionNumber'] = readInt()
-            newObject['NumberOfGeospecificControlPoints'] = readInt()
+            if len(fields) < len(_TextureAttributeFields):
+                raise struct.error('unpack requires a string argument of length ' + str(_TextureAttributeLayout.size))
             
             # Now process geospecific control point subrecord if there are some included.
             if newObject['NumberOfGeospecificControlPoints'] > 0:
-                # There are records to process.
-                skip(4)
+                # There are records to process. Skip the reserved word first.
+                offset = _TextureAttributeLayout.size + 4
                 varNames = ['TexelU', 'TexelV', 'EarthCoordinateX', 'EarthCoordinateY']
                 for idx in range(newObject['NumberOfGeospecificControlPoints']):
                     for varName in varNames:
-                        newObject[varName + str(idx)] = readDouble()
+                        newObject[varName + str(idx)] = _Double.unpack_from(data, offset)[0]
+                        offset += _Double.size
                 
                 varNames = ['Left', 'Bottom', 'Right', 'Top']
-                newObject['NumberOfSubtextures'] = readInt()
+                newObject['NumberOfSubtextures'] = _Int.unpack_from(data, offset)[0]
+                offset += _Int.size
                 # Now iterate through the number of subtextures if there are any.
-                for idx in range('NumberOfSubtextures'):
-                    newObject['Name' + str(idx)] = readString(32)
-                    for varName in varNames:
-                        newObject[varName + str(idx)] = readInt()
+                subtexture = struct.Struct('>32s4i')
+                for idx in range(newObject['NumberOfSubtextures']):
+                    values = subtexture.unpack_from(data, offset)
+                    offset += subtexture.size
+                    newObject['Name' + str(idx)] = values[0].replace('\x00', '')
+                    for varName, value in zip(varNames, values[1:]):
+                        newObject[varName + str(idx)] = value
         except struct.error, e:
-            print "\n" '\t' * self._tabbing + "Warning: Error parsing texture attribute file. Likely ended unexpectedly."
-            print '\t' * self._tabbing + '\t Error message: ' + str(e) + '\n'
-            f.close()
-        except BaseException, e:
-            f.close()
-            # Now raise the exception outside the attribute parser so that it's picked up by the
-            # exterior try-except.
-            raise e
-        finally:
-            f.close()
+            _log.warning("Error parsing texture attribute file %s. Likely ended unexpectedly: %s", _describeSource(attrFile), e)
         
         return newObject
+
+    
+    # The dispatch table is built once, at the end of the class body so that the handlers
+    # above can be used as plain functions. The tuple order for OpCodes is (op_function,
+    # size, friendly name) and handlers are called with the reader as their argument.
+    # Readers look the handlers up again by name, so subclasses can override them.
+    _OpCodes = {   0:    (_opReserved, None, 'padding'),
+                   1:    (_opHeader, 324, 'header'),
+                   2:    (_opGroup, 44, 'group'),
+                   4:    (_opObject, 28, 'object'),
+                   5:    (_opFace, 80, 'face'),
+                  10:    (_opPush, 4, 'push'),
+                  11:    (_opPop, 4, 'pop'),
+                  14:    (_opDoF, 384, 'degree of freedom'),
+                  19:    (_opPushSubface, 4, 'push subface'),
+                  20:    (_opPopSubface, 4, 'pop subface'),
+                  21:    (_opPushExtension, 24, 'push extension'),
+                  22:    (_opPopExtension, 24, 'pop extension'),
+                  23:    (_opContinuation, None, 'continuation'),
+                  31:    (_opComment, None, 'comment'),
+                  32:    (_opColourPalette, None, 'colour palette'),
+                  33:    (_opLongID, None, 'long ID'),
+                  49:    (_opMatrix, 68, 'matrix'),
+                  50:    (_opVector, 16, 'vector'),
+                  52:    (_opMultitexture, None, 'multitexture'),
+                  53:    (_opUVList, 8, 'UV list'),
+                  55:    (_opBSP, 48, 'binary separating plane'),
+                  60:    (_opReplicate, 8, 'replicate'),
+                  61:    (_opInstRef, 8, 'instance reference'),
+                  62:    (_opInstDef, 8, 'instance definition'),
+                  63:    (_opExtRef, 216, 'external reference'),
+                  64:    (_opTexturePalette, 216, 'texture palette'),
+                  67:    (_opVertexPalette, 8, 'vertex palette'),
+                  68:    (_opVertexColour, 40, 'vertex with colour'),
+                  69:    (_opVertexColNorm, 56, 'vertex with colour and normal'),
+                  70:    (_opVertexColNormUV, 64, 'vertex with colour, normal and UV'),
+                  71:    (_opVertexColUV, 48, 'vertex with colour and UV'),
+                  72:    (_opVertexList, None, 'vertex list'),
+                  73:    (_opLoD, 80, 'level of detail'),
+                  74:    (_opBoundingBox, 52, 'bounding box'),
+                  76:    (_opRotEdge, 64, 'rotate about edge'),
+                  78:    (_opTranslate, 56, 'translate'),
+                  79:    (_opScale, 48, 'scale'),
+                  80:    (_opRotPoint, 48, 'rotate about point'),
+                  81:    (_opRotScPoint, 96, 'rotate and/or scale to point'),
+                  82:    (_opPut, 152, 'put'),
+                  83:    (_opEyeTrackPalette, 4008, 'eyepoint and trackplane palette'),
+                  84:    (_opMesh, 84, 'mesh'),
+                  85:    (_opLocVertexPool, None, 'local vertex pool'),
+                  86:    (_opMeshPrim, None, 'mesh primitive'),
+                  87:    (_opRoadSeg, 12, 'road segment'),
+                  88:    (_opRoadZone, 176, 'road zone'),
+                  89:    (_opMorphVertex, None, 'morph vertex list'),
+                  90:    (_opLinkPalette, None, 'linkage palette'),
+                  91:    (_opSound, 88, 'sound'),
+                  92:    (_opRoadPath, 632, 'road path'),
+                  93:    (_opSoundPalette, None, 'sound palette'),
+                  94:    (_opGenMatrix, 68, 'general matrix'),
+                  95:    (_opText, 320, 'text'),
+                  96:    (_opSwitch, None, 'switch'),
+                  97:    (_opLineStylePalette, 12, 'line style palette'),
+                  98:    (_opClipRegion, 280, 'clip region'),
+                 100:    (_opExtension, None, 'extension'),
+                 101:    (_opLightSrc, 64, 'light source'),
+                 102:    (_opLightSrcPalette, 240, 'light source palette'),
+                 103:    (_opReserved, None, 'reserved'),
+                 104:    (_opReserved, None, 'reserved'),
+                 105:    (_opBoundSphere, 16, 'bounding sphere'),
+                 106:    (_opBoundCylinder, 24, 'bounding cylinder'),
+                 107:    (_opBoundConvexHull, None, 'bounding convex hull'),
+                 108:    (_opBoundVolCentre, 32, 'bounding volume centre'),
+                 109:    (_opBoundVolOrientation, 32, 'bounding volume orientation'),
+                 110:    (_opReserved, None, 'reserved'),
+                 111:    (_opLightPt, 156, 'light point'),
+                 112:    (_opTextureMapPalette, None, 'texture mapping palette'),
+                 113:    (_opMatPalette, 84, 'material palette'),
+                 114:    (_opNameTable, None, 'name table'),
+                 115:    (_opCAT, 80, 'continuously adaptive terrain (CAT)'),
+                 116:    (_opCATData, None, 'CAT data'),
+                 117:    (_opReserved, None, 'reserved'),
+                 118:    (_opReserved, None, 'reserved'),
+                 119:    (_opBoundHist, None, 'bounding histogram'),
+                 120:    (_opReserved, None, 'reserved'),
+                 121:    (_opReserved, None, 'reserved'),
+                 122:    (_opPushAttr, 8, 'push attribute'),
+                 123:    (_opPopAttr, 4, 'pop attribute'),
+                 124:    (_opReserved, None, 'reserved'),
+                 125:    (_opReserved, None, 'reserved'),
+                 126:    (_opCurve, None, 'curve'),
+                 127:    (_opRoadConstruc, 168, 'road construction'),
+                 128:    (_opLightPtAppearPalette, 412, 'light point appearance palette'),
+                 129:    (_opLightPtAnimatPalette, None, 'light point animation palette'),
+                 130:    (_opIdxLightPt, 28, 'indexed light point'),
+                 131:    (_opLightPtSys, 24, 'light point system'),
+                 132:    (_opIdxStr, None, 'indexed string'),
+                 133:    (_opShaderPalette, None, 'shader palette'),
+                 134:    (_opReserved, None, 'reserved'),
+                 135:    (_opExtMatHdr, 28, 'extended material header'),
+                 136:    (_opExtMatAmb, 48, 'extended material ambient'),
+                 137:    (_opExtMatDif, 48, 'extended material diffuse'),
+                 138:    (_opExtMatSpc, 48, 'extended material specular'),
+                 139:    (_opExtMatEms, 48, 'extended material emissive'),
+                 140:    (_opExtMatAlp, 44, 'extended material alpha'),
+                 141:    (_opExtMatLightMap, 16, 'extended material light map'),
+                 142:    (_opExtMatNormMap, 12, 'extended material normal map'),
+                 143:    (_opExtMatBumpMap, 20, 'extended material bump map'),
+                 144:    (_opReserved, None, 'reserved'),
+                 145:    (_opExtMatShadowMap, 16, 'extended material shadow map'),
+                 146:    (_opReserved, None, 'reserved'),
+                 147:    (_opExtMatReflMap, 32, 'extended material reflection map'),
+                 148:    (_opExtGUIDPalette, 48, 'extension GUID palette'),
+                 149:    (_opExtFieldBool, 12, 'extension field boolean'),
+                 150:    (_opExtFieldInt, 12, 'extension field integer'),
+                 151:    (_opExtFieldFloat, 12, 'extension field float'),
+                 152:    (_opExtFieldDouble, 16, 'extension field double'),
+                 153:    (_opExtFieldString, None, 'extension field string'),
+                 154:    (_opExtFieldXMLString, None, 'extension field XML string record')}
+    
+    # The checks made by isOpenFlight, in the same order as _ErrorMessages
+    _Checks = [_check_filesize, _check_header]
+
+
+def _expandPaths(paths):
+    """
+        Expands a list of file names, glob patterns and directories into a
+        sorted list of unique file names. Directories are searched for .flt
+        files, and compressed .flt files, including their subdirectories.
+    """
+    suffixes = tuple(['.flt'] + ['.flt' + suffix for magic, compression, suffix in _CompressionFormats])
+    if isinstance(paths, basestring):
+        paths = [paths]
+    fileNames = set()
+    for path in paths:
+        matches = glob.glob(path) if glob.has_magic(path) else [path]
+        for match in matches:
+            if os.path.isdir(match):
+                for root, dirNames, names in os.walk(match):
+                    fileNames.update(os.path.join(root, name) for name in names if name.lower().endswith(suffixes))
+            else:
+                fileNames.add(match)
+    return sorted(fileNames)
+
+# Each worker keeps one reader, and reuses it for every file read with the same options
+_BatchReaders = threading.local()
+
+def _batchReader(options):
+    """
+        Returns the reader of this worker for the given options.
+    """
+    if getattr(_BatchReaders, 'options', None) != options:
+        _BatchReaders.reader = OpenFlight(**options)
+        _BatchReaders.options = options
+    return _BatchReaders.reader
+
+def _readBatchFile(task):
+    """
+        Reads one file of a batch and returns a summary of the result. The
+        records are only included when they have been asked for.
+    """
+    fileName, options, returnRecords = task
+    result = {'FileName': fileName, 'Records': None, 'Error': None, 'Bytes': 0, 'Seconds': 0.0}
+    start = time.time()
+    try:
+        result['Bytes'] = os.path.getsize(fileName)
+        db = _batchReader(options)
+        try:
+            records = db.Load(fileName)
+            if hasattr(db, 'e'):
+                raise db.e
+            if returnRecords:
+                result['Records'] = records
+        finally:
+            # Let go of the records while the reader waits for the next file
+            db.Reset()
+    except Exception, e:
+        result['Error'] = e.__class__.__name__ + ': ' + str(e)
+    result['Seconds'] = time.time() - start
+    return result
+
+def ReadFiles(paths, workers = None, returnRecords = True, **options):
+    """
+        Reads a batch of OpenFlight files with a pool of worker processes and
+        yields a result for each file as soon as it is done, so results are
+        not necessarily in order. The paths can be file names, glob patterns
+        or directories.
+        
+        Each result is a dictionary holding the FileName, Records, Error
+        (None on success), Bytes and Seconds. Set returnRecords to False to
+        only collect timings and errors, for example when the files are being
+        saved to a cache directory. Any other keyword arguments are passed
+        to each OpenFlight reader. Workers defaults to one per CPU.
+        
+        Worker processes cannot start pools of their own, so externalWorkers
+        is ignored unless a single worker is used, and the options must be
+        picklable. A ValueError is raised straight away when they are not.
+    """
+    if workers != 1:
+        if options.get('externalWorkers') is not None:
+            _log.warning("External references are read in turn by each batch worker, as worker processes cannot start their own pool.")
+            options = dict(options, externalWorkers = None)
+        try:
+            cPickle.dumps(options, cPickle.HIGHEST_PROTOCOL)
+        except Exception, e:
+            raise ValueError('Unable to pass the reader options to the worker processes: ' + str(e))
+    tasks = [(fileName, options, returnRecords) for fileName in _expandPaths(paths)]
+    return _readBatch(tasks, workers)
+
+def _readBatch(tasks, workers):
+    """
+        Yields the result of each batch task, reading them in this process
+        when there is a single worker.
+    """
+    if workers == 1:
+        for task in tasks:
+            yield _readBatchFile(task)
+        return
+    
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap_unordered(_readBatchFile, tasks):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def BenchmarkCompressed(fileName, repeat = 3, **options):
+    """
+        Times reading a compressed OpenFlight file directly against first
+        decompressing it to a temporary file and reading that, taking the
+        best of the given number of repeats. Returns a dictionary holding
+        the Compression, CompressedBytes, Bytes, Compressed time in seconds
+        and Decompressed time, which includes writing the temporary file.
+        Any other keyword arguments are passed to each OpenFlight reader.
+    """
+    import tempfile
+    compression = _compression(fileName)
+    if compression is None:
+        raise IOError('The file is not compressed.')
+    result = {'Compression': compression, 'CompressedBytes': os.path.getsize(fileName), 'Bytes': 0}
+    
+    best = None
+    for i in range(repeat):
+        start = timeit.default_timer()
+        OpenFlight(**options).Load(fileName)
+        elapsed = timeit.default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    result['Compressed'] = best
+    
+    best = None
+    for i in range(repeat):
+        handle, tempName = tempfile.mkstemp(suffix = '.flt')
+        try:
+            start = timeit.default_timer()
+            source = _openCompressed(fileName, compression)
+            try:
+                f = os.fdopen(handle, 'wb')
+                handle = None
+                try:
+                    while True:
+                        data = source.read(_CompressedChunkSize)
+                        if not data:
+                            break
+                        f.write(data)
+                    result['Bytes'] = f.tell()
+                finally:
+                    f.close()
+            finally:
+                source.close()
+            OpenFlight(**options).Load(tempName)
+            elapsed = timeit.default_timer() - start
+        finally:
+            if handle is not None:
+                os.close(handle)
+            os.remove(tempName)
+        best = elapsed if best is None else min(best, elapsed)
+    result['Decompressed'] = best
+    return result
+
+def main(argv = None):
+    """
+        Reads a batch of OpenFlight files from the command line and reports
+        the time taken for each file, any errors and the overall throughput:
+        
+            python -m OpenFlight [-j WORKERS] [--cache-dir DIR] PATH [PATH ...]
+        
+        With --benchmark-compressed, each compressed file is instead timed
+        being read directly and being decompressed to disk first.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog = 'python -m OpenFlight', description = 'Read OpenFlight files and report timings and errors.')
+    parser.add_argument('paths', nargs = '+', help = 'files, glob patterns or directories to read')
+    parser.add_argument('-j', '--workers', type = int, default = None, help = 'number of worker processes (default: one per CPU)')
+    parser.add_argument('--cache-dir', dest = 'cacheDirectory', default = None, help = 'save parsed files to this parse cache directory')
+    parser.add_argument('--memory-map', dest = 'memoryMap', action = 'store_true', help = 'memory map files while reading')
+    parser.add_argument('--bulk-vertices', dest = 'bulkVertices', action = 'store_true', help = 'decode vertex palettes in bulk')
+    parser.add_argument('-v', '--verbose', action = 'store_true', help = 'log the progress messages of each reader')
+    parser.add_argument('--benchmark-compressed', dest = 'benchmarkCompressed', action = 'store_true', help = 'compare reading compressed files with decompressing them first')
+    args = parser.parse_args(argv)
+    
+    if args.verbose:
+        logging.basicConfig(level = logging.INFO, format = '%(processName)s %(levelname)s %(message)s')
+    
+    if args.benchmarkCompressed:
+        for fileName in _expandPaths(args.paths):
+            if _compression(fileName) is None:
+                continue
+            result = BenchmarkCompressed(fileName, memoryMap = args.memoryMap, bulkVertices = args.bulkVertices)
+            print '%8.3fs compressed  %8.3fs decompressed first  %s (%s, %d -> %d bytes)' % (result['Compressed'], result['Decompressed'], fileName, result['Compression'], result['CompressedBytes'], result['Bytes'])
+        return 0
+    
+    fileCount = 0
+    failures = 0
+    totalBytes = 0
+    start = time.time()
+    for result in ReadFiles(args.paths, workers = args.workers, returnRecords = False, cacheDirectory = args.cacheDirectory, memoryMap = args.memoryMap, bulkVertices = args.bulkVertices):
+        fileCount += 1
+        totalBytes += result['Bytes']
+        if result['Error'] is None:
+            print '%8.3fs  %s' % (result['Seconds'], result['FileName'])
+        else:
+            failures += 1
+            print '%8.3fs  %s  FAILED: %s' % (result['Seconds'], result['FileName'], result['Error'])
+    elapsed = time.time() - start
+    
+    print '%d files read, %d failed, in %.3fs' % (fileCount, failures, elapsed)
+    if elapsed > 0:
+        print '%.1f files/s, %.2f MB/s' % (fileCount / elapsed, totalBytes / elapsed / 1e6)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,725 @@
+import os, sys, gc, bz2, gzip, shutil, struct, tarfile, tempfile, unittest, zipfile, cPickle, cStringIO
+import numpy as np
+
+import OpenFlight
+
+def _record(opCode, body = ''):
+    return struct.pack('>hH', opCode, len(body) + 4) + body
+
+def _header(name = 'db'):
+    body = bytearray(320)
+    struct.pack_into('>8si', body, 0, name, 1640)
+    # The unit multiplier and vertex storage type must both be 1
+    struct.pack_into('>H', body, 56, 1)
+    struct.pack_into('>H', body, 122, 1)
+    return _record(1, str(body))
+
+def _vertex(x, y, z, u, v):
+    # A vertex with colour, normal and UV
+    return _record(70, struct.pack('>HHdddfffffII4x', 0, 0, x, y, z, 0.0, 0.0, 1.0, u, v, 0, 0))
+
+def _face(name):
+    # A face with every index left unset
+    return _record(5, struct.pack('>8sIhB?HHxBhhhhhIhBBIB7xIIh2xii2xh', name, 0, 0, 0, False, 0, 0, 0, -1, -1, -1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, -1, -1, -1, -1))
+
+def _mesh(name):
+    # A mesh with every index left unset
+    return _record(84, struct.pack('>8s4xIhB?HHxBhhhhhIHBBIB7xIIh2xii2xh', name, 0, 0, 0, False, 0, 0, 0, -1, -1, -1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, -1, -1, -1, -1))
+
+def _database(texture = None):
+    """
+        Returns a small database holding a group with an object of two faces
+        and a mesh, using a vertex palette of three vertices and, if given, a
+        texture palette naming the texture file.
+    """
+    vertices = _vertex(0.0, 0.0, 0.0, 0.0, 0.0) + _vertex(1.0, 0.0, 0.0, 1.0, 0.0) + _vertex(0.0, 1.0, 0.0, 0.0, 1.0)
+    push = _record(10)
+    pop = _record(11)
+    vertexList = _record(72, struct.pack('>3I', 8, 72, 136))
+    palette = '' if texture is None else _record(64, struct.pack('>200s3I', texture, 0, 0, 0))
+    return (_header() + palette + _record(67, struct.pack('>I', 8 + len(vertices))) + vertices +
+            _record(2, struct.pack('>8sh2xIhhhB5xIff', 'g1', 0, 0, 0, 0, 0, 0, 0, 0.0, 0.0)) + push +
+            _record(4, struct.pack('>8sIhHhhh2x', 'o1', 0, 0, 0, 0, 0, 0)) + push +
+            _face('f1') + push + vertexList + pop +
+            _face('f2') + push + vertexList + pop +
+            _mesh('m1') + pop + pop)
+
+def _externals(name, fileNames):
+    # A database holding nothing but external references to the given files
+    return _header(name) + ''.join(_record(63, struct.pack('>200s4xIH2x', fileName, 0, 0)) for fileName in fileNames)
+
+def _meshDatabase(pools, primitives):
+    """
+        Returns a database holding a mesh with the given local vertex pool
+        and mesh primitive records.
+    """
+    return _header() + _mesh('m1') + _record(10) + ''.join(pools) + ''.join(primitives) + _record(11)
+
+# The fields of a local vertex pool entry for each bit of the attribute mask, in order
+_PoolFields = [('Coordinate', 'ddd'), ('Colour', 'BBBB'), ('Colour', 'BBBB'), ('Normal', 'fff')] + [(name, 'ff') for name in ['UVBase'] + ['UV' + str(idx) for idx in range(1, 8)]]
+
+def _localVertexPool(mask, count):
+    """
+        Returns a local vertex pool record with the given attribute mask and
+        count of vertices, each filled with distinct values.
+    """
+    body = struct.pack('>II', count, mask)
+    value = 0
+    for idx in range(count):
+        for bit, (name, fmt) in enumerate(_PoolFields):
+            if mask & (1 << bit):
+                values = range(value, value + len(fmt))
+                value += len(fmt)
+                body += struct.pack('>' + fmt, *values)
+    return _record(85, body)
+
+def _decodeLocalVertexPool(body):
+    """
+        Decodes the body of a local vertex pool one field at a time.
+    """
+    count, mask = struct.unpack_from('>II', body)
+    offset = 8
+    vertices = []
+    for idx in range(count):
+        vertex = dict()
+        for bit, (name, fmt) in enumerate(_PoolFields):
+            if mask & (1 << bit):
+                vertex[name] = list(struct.unpack_from('>' + fmt, body, offset))
+                offset += struct.calcsize('>' + fmt)
+        vertices.append(vertex)
+    return vertices
+
+def _meshPrimitive(indexSize, indices):
+    fmt = {1: 'b', 2: 'h', 4: 'i'}[indexSize]
+    body = struct.pack('>hHI', 1, indexSize, len(indices)) + struct.pack('>' + fmt * len(indices), *indices)
+    # Records are padded to a multiple of four bytes
+    return _record(86, body + '\x00' * (-len(body) % 4))
+
+
+class OpenFlightTestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fileName = self.write('db.flt', _database())
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def write(self, name, data):
+        fileName = os.path.join(self.directory, name)
+        f = open(fileName, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        return fileName
+    
+    def read(self, source = None, **options):
+        db = OpenFlight.OpenFlight(self.fileName if source is None else source, **options)
+        db.ReadFile()
+        self.assertFalse(hasattr(db, 'e'), getattr(db, 'e', None))
+        return db
+
+
+class TestVertexStore(OpenFlightTestCase):
+    
+    def test_mapping(self):
+        vertices = self.read().Records['Vertices']
+        self.assertEqual(len(vertices), 3)
+        self.assertEqual(vertices.keys(), [8, 72, 136])
+        self.assertEqual([byteOffset for byteOffset, vertex in vertices.items()], [8, 72, 136])
+        self.assertEqual([vertex['Datatype'] for vertex in vertices.values()], ['VertexColourWithNormalUV'] * 3)
+        self.assertEqual(vertices.get(72)['Coordinate'].tolist(), [[1.0, 0.0, 0.0]])
+        self.assertIsNone(vertices.get(12))
+        self.assertIn(136, vertices)
+        self.assertNotIn(12, vertices)
+    
+    def test_bulk_vertices(self):
+        plain = self.read().Records['Vertices']
+        bulk = self.read(bulkVertices = True).Records['Vertices']
+        np.testing.assert_array_equal(plain.Coordinate, bulk.Coordinate)
+        np.testing.assert_array_equal(plain.TextureCoordinate, bulk.TextureCoordinate)
+    
+    def test_tree_nodes(self):
+        # Vertices are only kept out of the tree when decoded in bulk
+        plain = self.read().Records['Tree']
+        self.assertEqual([node['Datatype'] for node in plain[1:4]], ['VertexColourWithNormalUV'] * 3)
+        bulk = self.read(bulkVertices = True).Records['Tree']
+        self.assertEqual(bulk[1], {'Datatype': 'VertexBlock', 'VertexDatatype': 'VertexColourWithNormalUV', 'NumberOfVertices': 3, 'FirstRow': 0})
+        self.assertEqual(bulk[2]['Datatype'], 'Group')
+    
+    def test_bulk_exclude(self):
+        for bulkVertices in [False, True]:
+            db = OpenFlight.OpenFlight(self.fileName, bulkVertices = bulkVertices)
+            db.ReadFile(exclude = [70])
+            self.assertEqual(len(db.Records['Vertices']), 0)
+            self.assertEqual([node['Datatype'] for node in db.Records['Tree'][:2]], ['VertexPalette', 'Group'])
+            self.assertEqual(db.Records['Tree'][2][1][1][0]['ByteOffset'].tolist(), [8, 72, 136])
+    
+    def test_vertex_uv(self):
+        records = self.read().Records
+        self.assertEqual([uv.tolist() for uv in records['VertexUV']], [[[0.0, 0.0]], [[1.0, 0.0]], [[0.0, 1.0]]])
+
+
+class TestFaceTable(OpenFlightTestCase):
+    
+    _Indices = ['DetailTexturePatternIdx', 'TexturePatternIdx', 'MaterialIdx', 'TextureMappingIdx', 'PrimaryColourIdx', 'AltColourIdx', 'ShaderIdx']
+    
+    def test_columns(self):
+        faces = self.read(faceTable = True).Records['Faces']
+        self.assertEqual(len(faces), 3)
+        self.assertEqual(faces.column('OpCode').tolist(), [5, 5, 84])
+        self.assertEqual(faces.column('ASCIIID').tolist(), ['f1', 'f2', 'm1'])
+        self.assertEqual(faces.find(OpCode = 84).tolist(), [2])
+    
+    def test_unset_indices(self):
+        faces = self.read(faceTable = True).Records['Faces']
+        for varName in self._Indices:
+            self.assertEqual(faces.column(varName).tolist(), [-1, -1, -1], varName)
+            self.assertEqual((faces.column(varName) >= 0).sum(), 0)
+        for row, datatype in enumerate(['Face', 'Face', 'Mesh']):
+            face = faces[row]
+            self.assertEqual(face['Datatype'], datatype)
+            for varName in self._Indices:
+                self.assertIsNone(face[varName], varName)
+    
+    def test_records_match_table(self):
+        tree = self.read().Records['Tree']
+        faces = [tree[5][1][0], tree[5][1][2], tree[5][1][4]]
+        table = self.read(faceTable = True).Records['Faces']
+        for row, face in enumerate(faces):
+            for varName in self._Indices:
+                self.assertIsNone(face[varName], varName)
+            self.assertEqual(face, table[row])
+
+
+class TestParseCache(OpenFlightTestCase):
+    
+    def setUp(self):
+        OpenFlightTestCase.setUp(self)
+        self.cacheDirectory = os.path.join(self.directory, 'cache')
+        # Store every array in the data file, as the test database is tiny
+        self.arrayBytes = OpenFlight._CacheArrayBytes
+        OpenFlight._CacheArrayBytes = 0
+    
+    def tearDown(self):
+        OpenFlight._CacheArrayBytes = self.arrayBytes
+        OpenFlightTestCase.tearDown(self)
+    
+    def entries(self):
+        return sorted(os.path.join(self.cacheDirectory, name) for name in os.listdir(self.cacheDirectory))
+    
+    def assertRecords(self, db):
+        np.testing.assert_array_equal(db.Records['Vertices'].Coordinate, [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        self.assertEqual([node['Datatype'] for node in db.Records['Tree'][5][1] if isinstance(node, dict)], ['Face', 'Face', 'Mesh'])
+    
+    def test_round_trip(self):
+        self.assertRecords(self.read(cacheDirectory = self.cacheDirectory))
+        self.assertEqual(len(self.entries()), 2)
+        db = self.read(cacheDirectory = self.cacheDirectory)
+        self.assertRecords(db)
+        self.assertTrue(db.Records['Vertices'].Coordinate.base is not None)
+    
+    def test_truncated_entry(self):
+        self.read(cacheDirectory = self.cacheDirectory)
+        for fileName in self.entries():
+            f = open(fileName, 'r+b')
+            try:
+                f.truncate(os.path.getsize(fileName) // 2)
+            finally:
+                f.close()
+        # The broken entry is discarded, the file parsed and the entry saved again
+        self.assertRecords(self.read(cacheDirectory = self.cacheDirectory))
+        self.assertRecords(self.read(cacheDirectory = self.cacheDirectory))
+    
+    def test_mismatched_data_file(self):
+        self.read(cacheDirectory = self.cacheDirectory)
+        dataFile = [fileName for fileName in self.entries() if fileName.endswith('.data')][0]
+        shutil.copy(dataFile, dataFile + '.old')
+        for fileName in self.entries():
+            if not fileName.endswith('.old'):
+                os.remove(fileName)
+        self.read(cacheDirectory = self.cacheDirectory)
+        # Pair the new tree with the data file of the first save
+        shutil.move(dataFile + '.old', dataFile)
+        self.assertRecords(self.read(cacheDirectory = self.cacheDirectory))
+    
+    def test_texture_attributes(self):
+        texture = self.write('texture.rgb', '')
+        layout = OpenFlight._TextureAttributeLayout
+        self.write('texture.rgb.attr', struct.pack('>ii', 8, 8) + '\x00' * (layout.size - 8))
+        fileName = self.write('textured.flt', _database(texture))
+        self.assertEqual(self.read(fileName, cacheDirectory = self.cacheDirectory).Records['External'][texture]['NumberOfTexelsU'], 8)
+        # Rewriting the attribute file, but not the texture, invalidates the entry
+        self.write('texture.rgb.attr', struct.pack('>ii', 16, 16) + '\x00' * (layout.size - 4))
+        self.assertEqual(self.read(fileName, cacheDirectory = self.cacheDirectory).Records['External'][texture]['NumberOfTexelsU'], 16)
+
+
+class TestTextureAttributes(OpenFlightTestCase):
+    
+    def setUp(self):
+        OpenFlightTestCase.setUp(self)
+        self.texture = self.write('texture.rgb', '')
+        self.attrFile = self.write('texture.rgb.attr', self.attributes(8))
+        self.fileName = self.write('textured.flt', _database(self.texture))
+    
+    def attributes(self, texels):
+        return struct.pack('>ii', texels, texels) + '\x00' * (OpenFlight._TextureAttributeLayout.size - 8)
+    
+    def test_parse(self):
+        attributes = self.read().Records['External'][self.texture]
+        self.assertEqual(attributes['Datatype'], 'TextureAttribute')
+        self.assertEqual(attributes['NumberOfTexelsU'], 8)
+    
+    def test_external_cache(self):
+        cache = OpenFlight.ExternalCache()
+        first = self.read(externalCache = cache).Records['External'][self.texture]
+        self.assertIs(self.read(externalCache = cache).Records['External'][self.texture], first)
+        self.assertEqual(cache.hits, 1)
+        # Changing the file replaces its entry rather than adding another
+        self.write('texture.rgb.attr', self.attributes(16) + '\x00' * 4)
+        self.assertEqual(self.read(externalCache = cache).Records['External'][self.texture]['NumberOfTexelsU'], 16)
+        self.assertEqual(cache.invalidations, 1)
+        self.assertEqual(len(cache), 1)
+    
+    def test_texture_workers(self):
+        cache = OpenFlight.ExternalCache()
+        attributes = self.read(externalCache = cache, textureWorkers = 2).Records['External'][self.texture]
+        self.assertEqual(attributes['NumberOfTexelsU'], 8)
+        self.assertIs(self.read(externalCache = cache).Records['External'][self.texture], attributes)
+
+
+class TestInstrumentation(OpenFlightTestCase):
+    
+    def test_read_file(self):
+        db = self.read(instrument = True)
+        stats = db.Statistics()
+        self.assertEqual(stats['OpCodes']['face']['Count'], 2)
+        self.assertTrue(gc.isenabled())
+    
+    def test_iter_records(self):
+        db = OpenFlight.OpenFlight(self.fileName, instrument = True)
+        for event, opCode, depth, record in db.IterRecords():
+            if OpenFlight._PauseCollections:
+                self.assertFalse(gc.isenabled())
+        self.assertTrue(gc.isenabled())
+        self.assertEqual(db.Statistics()['OpCodes']['face']['Count'], 2)
+
+
+class TestProgress(OpenFlightTestCase):
+    
+    def test_progress(self):
+        reports = []
+        self.read(progress = lambda *report: reports.append(report), progressInterval = 5)
+        self.assertEqual([records for position, size, records, rate in reports], [5, 10, 15, 19])
+        self.assertEqual(reports[-1][:2], (len(_database()), len(_database())))
+    
+    def test_interval(self):
+        for progressInterval in [0, -1]:
+            self.assertRaises(ValueError, OpenFlight.OpenFlight, self.fileName, progressInterval = progressInterval)
+
+
+class TestSources(OpenFlightTestCase):
+    
+    def assertSameRecords(self, db, expected):
+        np.testing.assert_array_equal(db.Records['Vertices'].Coordinate, expected.Records['Vertices'].Coordinate)
+        self.assertEqual(len(db.Records['Tree']), len(expected.Records['Tree']))
+        self.assertEqual(db.Records['Tree'][5][1][0], expected.Records['Tree'][5][1][0])
+        self.assertEqual(db.DBName, expected.DBName)
+    
+    def test_data(self):
+        expected = self.read()
+        data = _database()
+        self.assertSameRecords(self.read(data), expected)
+        self.assertSameRecords(self.read(bytearray(data)), expected)
+        self.assertSameRecords(self.read(memoryview(data)), expected)
+    
+    def test_file_object(self):
+        expected = self.read()
+        f = open(self.fileName, 'rb')
+        try:
+            self.assertSameRecords(self.read(f), expected)
+            self.assertFalse(f.closed)
+        finally:
+            f.close()
+        self.assertSameRecords(self.read(cStringIO.StringIO(_database())), expected)
+    
+    def test_memory_map(self):
+        self.assertSameRecords(self.read(memoryMap = True), self.read())
+    
+    def test_load(self):
+        db = OpenFlight.OpenFlight(memoryMap = True)
+        first = db.Load(self.fileName)
+        second = db.Load(_database())
+        self.assertIsNot(first, second)
+        np.testing.assert_array_equal(first['Vertices'].Coordinate, second['Vertices'].Coordinate)
+
+
+class TestCompression(OpenFlightTestCase):
+    
+    def compress(self, compression, data):
+        if compression == 'gzip':
+            out = cStringIO.StringIO()
+            f = gzip.GzipFile(fileobj = out, mode = 'wb')
+            f.write(data)
+            f.close()
+            return out.getvalue()
+        return bz2.compress(data)
+    
+    def assertSameRecords(self, db, expected):
+        np.testing.assert_array_equal(db.Records['Vertices'].Coordinate, expected.Records['Vertices'].Coordinate)
+        self.assertEqual(db.Records['Tree'][4], expected.Records['Tree'][4])
+        self.assertEqual(db.Records['Tree'][5][1][4], expected.Records['Tree'][5][1][4])
+        np.testing.assert_array_equal(db.Records['VertexList'], expected.Records['VertexList'])
+    
+    def test_files(self):
+        expected = self.read()
+        for compression, suffix in [('gzip', '.gz'), ('bz2', '.bz2')]:
+            fileName = self.write('db.flt' + suffix, self.compress(compression, _database()))
+            self.assertSameRecords(self.read(fileName), expected)
+            self.assertSameRecords(self.read(self.compress(compression, _database())), expected)
+    
+    def test_small_chunks(self):
+        # Decompress a few bytes at a time, across several concatenated streams
+        chunkSize = OpenFlight._CompressedChunkSize
+        OpenFlight._CompressedChunkSize = 7
+        try:
+            expected = self.read()
+            data = _database()
+            for compression in ['gzip', 'bz2']:
+                streams = self.compress(compression, data[:100]) + self.compress(compression, data[100:])
+                self.assertSameRecords(self.read(streams), expected)
+        finally:
+            OpenFlight._CompressedChunkSize = chunkSize
+    
+    def test_external_reference(self):
+        tile = os.path.join(self.directory, 'tile.flt')
+        self.write('tile.flt.gz', self.compress('gzip', _database()))
+        master = self.write('master.flt', _header() + _record(63, struct.pack('>200s4xIH2x', tile, 0, 0)))
+        external = self.read(master).Records['External']
+        self.assertEqual(external.keys(), [tile + '.gz'])
+        self.assertEqual(len(external[tile + '.gz']['Vertices']), 3)
+
+
+class TestContinuation(OpenFlightTestCase):
+    
+    def setUp(self):
+        OpenFlightTestCase.setUp(self)
+        # The vertex list of the first face is split after its first offset, and again after its second
+        vertexList = _record(72, struct.pack('>3I', 8, 72, 136))
+        continued = _record(72, struct.pack('>I', 8)) + _record(23, struct.pack('>I', 72)) + _record(23, struct.pack('>I', 136))
+        data = _database()
+        self.assertEqual(data.count(vertexList), 2)
+        self.fileName = self.write('continued.flt', data.replace(vertexList, continued, 1))
+    
+    def test_joined(self):
+        for options in [{}, {'memoryMap': True}]:
+            db = self.read(**options)
+            self.assertEqual([offsets.tolist() for offsets in db.Records['VertexList']], [[8, 72, 136], [8, 72, 136]])
+            self.assertEqual(db.Records['Tree'][5][1][1][0]['ByteOffset'].tolist(), [8, 72, 136])
+    
+    def test_data(self):
+        f = open(self.fileName, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        self.assertEqual(self.read(data).Records['VertexList'][0].tolist(), [8, 72, 136])
+
+
+class TestMesh(OpenFlightTestCase):
+    
+    _Masks = [0x01, 0x01 | 0x08 | 0x10, 0x01 | 0x04, 0x02 | 0x20 | 0x40, 0x01 | 0x02 | 0x08 | 0xff0]
+    
+    def test_local_vertex_pools(self):
+        pools = [_localVertexPool(mask, 3) for mask in self._Masks]
+        self.fileName = self.write('mesh.flt', _meshDatabase(pools, []))
+        for options in [{}, {'memoryMap': True}]:
+            nodes = self.read(**options).Records['Tree'][1]
+            self.assertEqual(len(nodes), len(pools))
+            for pool, node in zip(pools, nodes):
+                self.assertEqual(node['Datatype'], 'LocalVertexPool')
+                expected = _decodeLocalVertexPool(pool[4:])
+                self.assertEqual(node['NumberOfVertices'], len(expected))
+                for name in expected[0]:
+                    self.assertEqual(node[name].tolist(), [vertex[name] for vertex in expected], name)
+                self.assertEqual(sorted(name for name in node if name not in ['Datatype', 'NumberOfVertices', 'AttributeMask']), sorted(expected[0]))
+    
+    def test_both_colours(self):
+        self.fileName = self.write('mesh.flt', _meshDatabase([_localVertexPool(0x06, 1)], []))
+        db = OpenFlight.OpenFlight(self.fileName)
+        db.ReadFile()
+        self.assertTrue(hasattr(db, 'e'))
+    
+    def test_mesh_primitives(self):
+        indices = {1: [0, 1, 2, -1, 127], 2: [0, 1000, -2, 32767], 4: [0, 70000, -3, 2 ** 31 - 1, 5]}
+        primitives = [_meshPrimitive(indexSize, indices[indexSize]) for indexSize in [1, 2, 4]]
+        self.fileName = self.write('mesh.flt', _meshDatabase([], primitives))
+        for options in [{}, {'memoryMap': True}]:
+            nodes = self.read(**options).Records['Tree'][1]
+            for indexSize, node in zip([1, 2, 4], nodes):
+                self.assertEqual(node['Datatype'], 'MeshPrimitive')
+                self.assertEqual(node['VertexCount'], len(indices[indexSize]))
+                self.assertEqual(node['VertexIndex'].tolist(), indices[indexSize])
+
+
+class TestIndexFile(OpenFlightTestCase):
+    
+    def test_index(self):
+        index = OpenFlight.OpenFlight(self.fileName).IndexFile()
+        self.assertEqual(index['OpCode'].tolist(), [1, 67, 70, 70, 70, 2, 10, 4, 10, 5, 10, 72, 11, 5, 10, 72, 11, 84, 11, 11])
+        self.assertEqual(index['Depth'].tolist(), [0, 0, 0, 0, 0, 0, 0, 1, 1, 2, 2, 3, 2, 2, 2, 3, 2, 2, 1, 0])
+        self.assertEqual(index['Length'].tolist(), [324, 8, 64, 64, 64, 44, 4, 28, 4, 80, 4, 16, 4, 80, 4, 16, 4, 84, 4, 4])
+        # Each record starts where the one before it ends
+        self.assertEqual(index['Offset'][1:].tolist(), np.cumsum(index['Length'])[:-1].tolist())
+    
+    def test_continuation(self):
+        vertexList = _record(72, struct.pack('>3I', 8, 72, 136))
+        continued = _record(72, struct.pack('>I', 8)) + _record(23, struct.pack('>I', 72)) + _record(23, struct.pack('>I', 136))
+        fileName = self.write('continued.flt', _database().replace(vertexList, continued, 1))
+        index = OpenFlight.OpenFlight(fileName).IndexFile()
+        plain = OpenFlight.OpenFlight(self.fileName).IndexFile()
+        self.assertEqual(index['OpCode'].tolist(), plain['OpCode'].tolist())
+        self.assertEqual(index['Depth'].tolist(), plain['Depth'].tolist())
+        # The continuation records are folded into the length of the vertex list
+        self.assertEqual(index['Length'][11], 8 + 8 + 8)
+        self.assertEqual(index['Offset'][12], index['Offset'][11] + 24)
+
+
+class TestIterRecords(OpenFlightTestCase):
+    
+    def test_events(self):
+        db = OpenFlight.OpenFlight(self.fileName)
+        events = [(event, opCode, depth, None if record is None else record['Datatype']) for event, opCode, depth, record in db.IterRecords()]
+        self.assertEqual(events, [('record', 67, 0, 'VertexPalette')] + [('record', 70, 0, 'VertexColourWithNormalUV')] * 3 +
+                         [('record', 2, 0, 'Group'), ('enter', 10, 0, None),
+                          ('record', 4, 1, 'Object'), ('enter', 10, 1, None),
+                          ('record', 5, 2, 'Face'), ('enter', 10, 2, None), ('record', 72, 3, 'VertexList'), ('exit', 11, 2, None),
+                          ('record', 5, 2, 'Face'), ('enter', 10, 2, None), ('record', 72, 3, 'VertexList'), ('exit', 11, 2, None),
+                          ('record', 84, 2, 'Mesh'), ('exit', 11, 1, None), ('exit', 11, 0, None)])
+        # The tree is not built, but the vertices are kept for the vertex lists
+        self.assertEqual(db.Records['Tree'], [])
+        self.assertEqual(len(db.Records['Vertices']), 3)
+    
+    def test_filtered(self):
+        db = OpenFlight.OpenFlight(self.fileName)
+        events = [(event, opCode, depth) for event, opCode, depth, record in db.IterRecords(include = 'hierarchy-only')]
+        self.assertEqual(events, [('record', 2, 0), ('enter', 10, 0), ('record', 4, 1), ('enter', 10, 1), ('exit', 11, 1), ('exit', 11, 0)])
+
+
+class TestCompactRecords(OpenFlightTestCase):
+    
+    def test_records(self):
+        plain = self.read().Records['Tree']
+        compact = self.read(compactRecords = True).Records['Tree']
+        group = compact[4]
+        self.assertIsInstance(group, OpenFlight.Record)
+        self.assertEqual(group.ASCIIID, 'g1')
+        self.assertEqual(group['ASCIIID'], 'g1')
+        self.assertEqual(group, plain[4])
+        self.assertEqual(plain[4], group)
+        self.assertEqual(compact[5][1][0], plain[5][1][0])
+        self.assertNotEqual(group, dict(plain[4], ASCIIID = 'g2'))
+        self.assertEqual(sorted(group.keys()), sorted(plain[4].keys()))
+        self.assertRaises(KeyError, group.__getitem__, 'Missing')
+    
+    def test_pickle(self):
+        group = self.read(compactRecords = True).Records['Tree'][4]
+        for protocol in range(cPickle.HIGHEST_PROTOCOL + 1):
+            copy = cPickle.loads(cPickle.dumps(group, protocol))
+            self.assertIs(type(copy), type(group))
+            self.assertEqual(copy, group)
+
+
+class TestDispatch(OpenFlightTestCase):
+    
+    def test_override(self):
+        class GroupCounter(OpenFlight.OpenFlight):
+            def _opGroup(self):
+                self.Groups = getattr(self, 'Groups', 0) + 1
+                OpenFlight.OpenFlight._opGroup(self)
+        
+        db = GroupCounter(self.fileName)
+        db.ReadFile()
+        self.assertEqual(db.Groups, 1)
+        self.assertEqual(db.Records['Tree'][4]['ASCIIID'], 'g1')
+        # The base class keeps its own handlers
+        self.assertFalse(hasattr(self.read(), 'Groups'))
+
+
+class TestFilters(OpenFlightTestCase):
+    
+    def datatypes(self, node):
+        return [self.datatypes(child) if isinstance(child, list) else child['Datatype'] for child in node]
+    
+    def test_unfiltered(self):
+        tree = self.read().Records['Tree']
+        self.assertEqual(self.datatypes(tree), ['VertexPalette'] + ['VertexColourWithNormalUV'] * 3 +
+                         ['Group', ['Object', ['Face', ['VertexList'], 'Face', ['VertexList'], 'Mesh']]])
+    
+    def test_hierarchy_only(self):
+        db = OpenFlight.OpenFlight(self.fileName)
+        db.ReadFile(include = 'hierarchy-only')
+        self.assertEqual(self.datatypes(db.Records['Tree']), ['Group', ['Object', []]])
+    
+    def test_geometry(self):
+        db = OpenFlight.OpenFlight(self.fileName)
+        db.ReadFile(include = 'geometry')
+        self.assertEqual(self.datatypes(db.Records['Tree']), ['VertexPalette'] + ['VertexColourWithNormalUV'] * 3 +
+                         ['Face', ['VertexList'], 'Face', ['VertexList'], 'Mesh'])
+
+
+class TestExternalReferences(OpenFlightTestCase):
+    
+    def setUp(self):
+        OpenFlightTestCase.setUp(self)
+        # The child and the parent both refer to the grandchild, which is read once
+        self.child = self.write('child.flt', _externals('child', [self.fileName]))
+        self.parent = self.write('parent.flt', _externals('parent', [self.child, self.fileName]))
+    
+    def summary(self, db):
+        external = db.Records['External']
+        return (sorted(external), [node['ASCIIPath'] for node in external[self.child]['Tree']],
+                external[self.fileName]['Tree'][4]['ASCIIID'], external[self.fileName]['Vertices'].Coordinate.tolist())
+    
+    def test_sequential(self):
+        db = self.read(self.parent)
+        self.assertEqual([node['ASCIIPath'] for node in db.Records['Tree']], [self.child, self.fileName])
+        self.assertEqual(self.summary(db), ([self.child, self.fileName], [self.fileName], 'g1', [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]))
+    
+    def test_external_workers(self):
+        sequential = self.read(self.parent)
+        pooled = self.read(self.parent, externalWorkers = 2)
+        self.assertEqual(pooled.Records['Tree'], sequential.Records['Tree'])
+        self.assertEqual(self.summary(pooled), self.summary(sequential))
+    
+    def test_external_cache(self):
+        sequential = self.read(self.parent)
+        cache = OpenFlight.ExternalCache()
+        self.assertEqual(self.summary(self.read(self.parent, externalWorkers = 2, externalCache = cache)), self.summary(sequential))
+        self.assertEqual(len(cache), 2)
+        # The second read takes both files from the cache rather than the pool
+        self.assertEqual(self.summary(self.read(self.parent, externalWorkers = 2, externalCache = cache)), self.summary(sequential))
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(self.summary(self.read(self.parent, externalCache = cache)), self.summary(sequential))
+
+
+class TestBundle(OpenFlightTestCase):
+    
+    def setUp(self):
+        OpenFlightTestCase.setUp(self)
+        # Names stored in the databases are absolute paths on the machine that made them
+        attributes = struct.pack('>ii', 8, 8) + '\x00' * (OpenFlight._TextureAttributeLayout.size - 8)
+        self.members = [('deliverable/master.flt', _externals('master', ['C:\\work\\Models\\child.flt'])),
+                        ('deliverable/models/child.flt', _database('C:\\work\\models\\textures\\tex.rgb')),
+                        ('deliverable/models/textures/tex.rgb', ''),
+                        ('deliverable/models/textures/tex.rgb.attr', attributes)]
+    
+    def zip(self, name, compression, members = None):
+        fileName = os.path.join(self.directory, name)
+        archive = zipfile.ZipFile(fileName, 'w', compression)
+        try:
+            for memberName, data in members or self.members:
+                archive.writestr(memberName, data)
+        finally:
+            archive.close()
+        return fileName
+    
+    def tar(self, name, mode):
+        fileName = os.path.join(self.directory, name)
+        archive = tarfile.open(fileName, mode)
+        try:
+            for memberName, data in self.members:
+                info = tarfile.TarInfo(memberName)
+                info.size = len(data)
+                archive.addfile(info, cStringIO.StringIO(data))
+        finally:
+            archive.close()
+        return fileName
+    
+    def test_archives(self):
+        for fileName in [self.zip('stored.zip', zipfile.ZIP_STORED), self.zip('deflated.zip', zipfile.ZIP_DEFLATED),
+                         self.tar('plain.tar', 'w'), self.tar('compressed.tar.gz', 'w:gz')]:
+            bundle = OpenFlight.Bundle(fileName)
+            try:
+                self.assertEqual(bundle.names(), sorted(name for name, data in self.members))
+                db = bundle.Reader()
+                db.ReadFile()
+                self.assertFalse(hasattr(db, 'e'), getattr(db, 'e', None))
+            finally:
+                bundle.close()
+            external = db.Records['External']
+            self.assertEqual(external['C:\\work\\Models\\child.flt']['Tree'][5]['ASCIIID'], 'g1')
+            self.assertEqual(external['C:\\work\\models\\textures\\tex.rgb']['NumberOfTexelsU'], 8)
+    
+    def test_case_collision(self):
+        fileName = self.zip('collision.zip', zipfile.ZIP_STORED, self.members + [('deliverable/Master.flt', '')])
+        self.assertRaises(IOError, OpenFlight.Bundle, fileName)
+
+
+class TestBatch(OpenFlightTestCase):
+    
+    def setUp(self):
+        OpenFlightTestCase.setUp(self)
+        os.mkdir(os.path.join(self.directory, 'sub'))
+        self.compressed = os.path.join(self.directory, 'sub', 'db.flt.gz')
+        f = gzip.open(self.compressed, 'wb')
+        try:
+            f.write(_database())
+        finally:
+            f.close()
+        self.broken = self.write('broken.flt', 'not an OpenFlight file')
+        self.write('notes.txt', '')
+    
+    def results(self, paths, **options):
+        return sorted(OpenFlight.ReadFiles(paths, **options), key = lambda result: result['FileName'])
+    
+    def test_expand_paths(self):
+        self.assertEqual(OpenFlight._expandPaths(self.directory), [self.broken, self.fileName, self.compressed])
+        self.assertEqual(OpenFlight._expandPaths([os.path.join(self.directory, '*.flt'), self.fileName]), [self.broken, self.fileName])
+        self.assertEqual(OpenFlight._expandPaths(self.fileName), [self.fileName])
+    
+    def test_read_files(self):
+        for workers in [1, 2]:
+            results = self.results(self.directory, workers = workers)
+            self.assertEqual([result['FileName'] for result in results], [self.broken, self.fileName, self.compressed])
+            self.assertIsNotNone(results[0]['Error'])
+            self.assertIsNone(results[0]['Records'])
+            for result in results[1:]:
+                self.assertIsNone(result['Error'])
+                self.assertEqual(result['Bytes'], os.path.getsize(result['FileName']))
+                self.assertEqual(result['Records']['Tree'][4]['ASCIIID'], 'g1')
+    
+    def test_without_records(self):
+        results = self.results(self.fileName, workers = 2, returnRecords = False)
+        self.assertIsNone(results[0]['Error'])
+        self.assertIsNone(results[0]['Records'])
+    
+    def test_external_workers(self):
+        parent = self.write('parent.flt', _externals('parent', [self.fileName]))
+        for workers in [1, 2]:
+            results = self.results(parent, workers = workers, externalWorkers = 2)
+            self.assertIsNone(results[0]['Error'])
+            self.assertEqual(results[0]['Records']['External'][self.fileName]['Tree'][4]['ASCIIID'], 'g1')
+    
+    def test_unpicklable_options(self):
+        # The options are checked before any file is read
+        self.assertRaises(ValueError, OpenFlight.ReadFiles, self.fileName, workers = 2, progress = lambda *report: None)
+        self.assertIsNone(self.results(self.fileName, workers = 1, progress = lambda *report: None)[0]['Error'])
+    
+    def test_main(self):
+        stdout = sys.stdout
+        sys.stdout = output = cStringIO.StringIO()
+        try:
+            self.assertEqual(OpenFlight.main(['-j', '1', self.fileName, self.compressed]), 0)
+            self.assertEqual(OpenFlight.main(['-j', '2', self.directory]), 1)
+        finally:
+            sys.stdout = stdout
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[2], '2 files read, 0 failed, in ' + lines[2].split(' in ')[1])
+        self.assertIn(self.broken + '  FAILED: ', [line for line in lines if 'FAILED' in line][0])
+        self.assertIn('3 files read, 1 failed', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()